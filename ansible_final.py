@@ -1,18 +1,24 @@
 import json
+import logging
 import os
 import subprocess
 import tempfile
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
+import bot_logging
 import netmiko_final
+import worker_pool
 
 
 BASE_DIR = Path(__file__).resolve().parent
 PLAYBOOK_DIR = BASE_DIR / "ansible" / "playbooks"
 INVENTORY_TEMPLATE = BASE_DIR / "ansible" / "host"
 ANSIBLE_CFG = BASE_DIR / "ansible" / "ansible.cfg"
-BACKUP_FILE = BASE_DIR / "ansible" / "backups" / "show_run_66070112_CSRv1000.txt"
+BACKUP_DIR = BASE_DIR / "ansible" / "backups"
+BACKUP_FILE = BACKUP_DIR / "show_run_66070112_CSRv1000.txt"
+PLAYBOOK_TIMEOUT = float(os.getenv("ANSIBLE_PLAYBOOK_TIMEOUT", "120"))
+log = logging.getLogger(__name__)
 
 
 def _updated_inventory_content(template_path: Path, target_ip: str) -> str:
@@ -57,13 +63,18 @@ def _run_playbook(playbook_name: str, target_ip: str, extra_vars: Optional[dict]
     env.setdefault("ANSIBLE_STDOUT_CALLBACK", "json")
 
     try:
-        process = subprocess.run(
+        process = worker_pool.run_command(
             command,
-            capture_output=True,
-            text=True,
+            timeout=PLAYBOOK_TIMEOUT,
             cwd=BASE_DIR,
             env=env,
         )
+    except subprocess.TimeoutExpired as exc:
+        log.warning("Ansible %s killed after %gs", playbook_name, exc.timeout)
+        return -1, exc.stdout or "", exc.stderr or ""
+    except worker_pool.JobCancelledError:
+        log.warning("Ansible %s cancelled", playbook_name)
+        return -1, "", ""
     finally:
         try:
             os.unlink(temp_inventory_path)
@@ -73,11 +84,16 @@ def _run_playbook(playbook_name: str, target_ip: str, extra_vars: Optional[dict]
     stdout = (process.stdout or "").strip()
     stderr = (process.stderr or "").strip()
     output_log = "\n".join(part for part in (stdout, stderr) if part)
-    print(f"Ansible ({playbook_name}) output:\n{output_log}\n")
+    log.info("Ansible %s finished", playbook_name, extra={"returncode": process.returncode, "host": target_ip})
+    bot_logging.log_payload(log, "Ansible output", output_log, playbook=playbook_name)
 
     return process.returncode, stdout, stderr
 
 
+def backup_path(target_ip: str) -> Path:
+    return BACKUP_DIR / f"{BACKUP_FILE.stem}-{target_ip}{BACKUP_FILE.suffix}"
+
+
 def showrun(target_ip: Optional[str] = None):
     if not target_ip:
         return {
@@ -86,14 +102,29 @@ def showrun(target_ip: Optional[str] = None):
             "file_path": None,
         }
 
-    returncode, _, _ = _run_playbook("backup_cisco_router_playbook.yml", target_ip)
-
-    if returncode == 0 and BACKUP_FILE.exists():
-        return {
-            "success": True,
-            "message": "show running config.",
-            "file_path": BACKUP_FILE,
-        }
+    # Jobs run concurrently, so every run writes its own scratch file and then
+    # atomically replaces the device's backup; an upload already reading the
+    # previous backup keeps its file intact.
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+    handle, scratch_path = tempfile.mkstemp(prefix=".showrun-", suffix=".txt", dir=BACKUP_DIR)
+    os.close(handle)
+    try:
+        returncode, _, _ = _run_playbook(
+            "backup_cisco_router_playbook.yml",
+            target_ip,
+            {"backup_file": scratch_path},
+        )
+        if returncode == 0 and os.path.getsize(scratch_path):
+            device_backup = backup_path(target_ip)
+            os.replace(scratch_path, device_backup)
+            return {
+                "success": True,
+                "message": "show running config.",
+                "file_path": device_backup,
+            }
+    finally:
+        if os.path.exists(scratch_path):
+            os.unlink(scratch_path)
 
     return {
         "success": False,
@@ -102,6 +133,35 @@ def showrun(target_ip: Optional[str] = None):
     }
 
 
+def showrun_many(target_ips: List[str]):
+    file_paths = []
+    failed = []
+
+    # "showrun 10.0.0.1 10.0.0.1" backs the device up once.
+    for target_ip in dict.fromkeys(target_ips):
+        result = showrun(target_ip)
+        if not result["success"]:
+            failed.append(target_ip)
+            continue
+        file_paths.append(result["file_path"])
+
+    if not file_paths:
+        return {
+            "success": False,
+            "message": "Error: Ansible.",
+            "file_paths": [],
+        }
+
+    message = "show running config."
+    if failed:
+        message += f" Error: Ansible on {', '.join(failed)}."
+    return {
+        "success": True,
+        "message": message,
+        "file_paths": file_paths,
+    }
+
+
 def motd(target_ip: Optional[str] = None, banner_message: Optional[str] = None):
     if not target_ip:
         return {
@@ -135,7 +195,7 @@ def motd(target_ip: Optional[str] = None, banner_message: Optional[str] = None):
     try:
         motd_value = netmiko_final.motd_banner(target_ip)
     except Exception as exc:
-        print(f"Netmiko MOTD error: {exc}")
+        log.warning("Netmiko MOTD error: %s", exc)
         motd_value = ""
 
     message = motd_value if motd_value else "Error: No MOTD configured."
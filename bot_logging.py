@@ -0,0 +1,143 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Events logged with extra={"sample": True} (per-tick noise) are limited to
+# LOG_SAMPLE_BURST per LOG_SAMPLE_WINDOW seconds; the rest are dropped and counted.
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+
+correlation_id: contextvars.ContextVar[str] = contextvars.ContextVar("correlation_id", default="-")
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "correlation_id", "sample"}
+
+
+@contextmanager
+def correlation(value: Optional[str]):
+    token = correlation_id.set(value or "-")
+    try:
+        yield
+    finally:
+        correlation_id.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # Only records marked as repetitive are sampled, keyed on the unformatted message,
+    # so "Response status code: %s" is one event however many ticks log it. Command
+    # events and warnings always pass.
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, window: float = LOG_SAMPLE_WINDOW):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sample", False) or record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = entry[2] if entry else 0
+                self._seen[key] = [now, 1, 0]
+                if suppressed:
+                    record.sampled_out = suppressed
+                return True
+            entry[1] += 1
+            if entry[1] <= self.burst:
+                return True
+            entry[2] += 1
+            return False
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool = False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RESERVED}
+        base = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "cid": getattr(record, "correlation_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+
+        if self.as_json:
+            base.update(fields)
+            return json.dumps(base, default=str)
+
+        extra = " ".join(f"{key}={value}" for key, value in fields.items())
+        line = f"{base['ts']} {base['level']:<7} {base['logger']} [{base['cid']}] {base['msg']}"
+        return f"{line} {extra}" if extra else line
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup(level: str = LOG_LEVEL, stream=None) -> None:
+    # Records are handed to a queue on the calling thread and formatted/written by a
+    # listener thread, so logging never blocks the poll loop or device workers on I/O.
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(StructuredFormatter(as_json=LOG_FORMAT == "json"))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # Third-party libraries stay quiet unless explicitly debugging them.
+    for noisy in ("ncclient", "paramiko", "netmiko", "urllib3"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_payload(logger: logging.Logger, kind: str, payload, **fields) -> None:
+    # Full NETCONF/RESTCONF bodies are only rendered when DEBUG is enabled.
+    if logger.isEnabledFor(logging.DEBUG):
+        text = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+        logger.debug("%s payload", kind, extra=dict(fields, payload=text))
@@ -0,0 +1,287 @@
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+
+BASE_DIR = Path(__file__).resolve().parent
+BACKUP_DIR = BASE_DIR / "ansible" / "backups"
+BACKUP_GLOB = "show_run_*.txt"
+# New backups are indexed by add_snapshot(); the directory itself is only rescanned this often.
+REFRESH_INTERVAL = float(os.getenv("CONFIG_INDEX_REFRESH_INTERVAL", "300"))
+GRAM = 3
+
+SECTIONS = ("interfaces", "routing", "acls", "banners", "lines", "global")
+MAX_RESULT_LINES = 50
+
+TOKEN_RE = re.compile(r"[a-z0-9_./:-]+")
+# Per-device backups are "show_run_<id>_<host>-<ip>.txt"; the old shared
+# show_run_<id>_<host>.txt is stale once per-device backups exist and is not indexed.
+BACKUP_NAME_RE = re.compile(r"^show_run_(?P<student_id>\d+)_(?P<device>.+-\d{1,3}(?:\.\d{1,3}){3})$")
+
+ROUTING_PREFIXES = ("router ", "ip route ", "ipv6 route ", "ipv6 router ", "ip prefix-list ", "route-map ")
+ACL_PREFIXES = ("ip access-list ", "ipv6 access-list ", "access-list ")
+
+
+def _device_from_path(path: Path) -> str:
+    match = BACKUP_NAME_RE.match(path.stem)
+    return match.group("device") if match else path.stem
+
+
+def is_backup(path: Path) -> bool:
+    return BACKUP_NAME_RE.match(Path(path).stem) is not None
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def _grams(token: str) -> Set[str]:
+    return {token[idx:idx + GRAM] for idx in range(len(token) - GRAM + 1)}
+
+
+def _classify(line: str) -> str:
+    lowered = line.lower()
+    if lowered.startswith("interface "):
+        return "interfaces"
+    if lowered.startswith(ROUTING_PREFIXES):
+        return "routing"
+    if lowered.startswith(ACL_PREFIXES):
+        return "acls"
+    if lowered.startswith("banner "):
+        return "banners"
+    if lowered.startswith("line "):
+        return "lines"
+    return "global"
+
+
+def _banner_delimiter(line: str) -> str:
+    # "banner motd ^C" -> "^C"; IOS prints the control character as caret notation.
+    parts = line.split(None, 2)
+    if len(parts) < 3 or not parts[2]:
+        return ""
+    text = parts[2]
+    return text[:2] if text.startswith("^") else text[0]
+
+
+def split_sections(lines: List[str]) -> List[str]:
+    sections = []
+    current = "global"
+    banner_end = ""
+
+    for line in lines:
+        if banner_end:
+            sections.append("banners")
+            if banner_end in line:
+                banner_end = ""
+            continue
+
+        if not line.strip() or line.startswith("!"):
+            current = "global"
+            sections.append(current)
+            continue
+
+        if not line[0].isspace():
+            current = _classify(line)
+            if current == "banners":
+                delimiter = _banner_delimiter(line)
+                body = line.split(None, 2)[2][len(delimiter):] if delimiter else ""
+                if delimiter and delimiter not in body:
+                    banner_end = delimiter
+
+        sections.append(current)
+
+    return sections
+
+
+class ConfigIndex:
+    def __init__(self, backup_dir: Path = BACKUP_DIR):
+        self.backup_dir = Path(backup_dir)
+        self._lock = threading.Lock()
+        # Everything is keyed by snapshot file name; one router may be backed up by several students.
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        self._devices: Dict[str, str] = {}
+        self._lines: Dict[str, List[str]] = {}
+        self._sections: Dict[str, List[str]] = {}
+        self._snapshot_tokens: Dict[str, Set[str]] = {}
+        # token -> snapshot -> line numbers containing that token
+        self._postings: Dict[str, Dict[str, List[int]]] = {}
+        # trigram -> indexed tokens containing it, for partial-token patterns
+        self._grams: Dict[str, Set[str]] = {}
+        self.refreshed_at: Optional[float] = None
+
+    def refresh(self) -> int:
+        # Only snapshots whose (mtime, size) changed since the last scan are re-indexed.
+        if not self.backup_dir.is_dir():
+            return 0
+
+        seen = set()
+        updated = 0
+        with self._lock:
+            self.refreshed_at = time.monotonic()
+            for path in self.backup_dir.glob(BACKUP_GLOB):
+                if not is_backup(path):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                seen.add(path.name)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if self._signatures.get(path.name) == signature:
+                    continue
+                self._index_file(path)
+                self._signatures[path.name] = signature
+                updated += 1
+
+            for key in list(self._signatures):
+                if key not in seen:
+                    self._drop(key)
+                    del self._signatures[key]
+
+        return updated
+
+    def add_snapshot(self, path: Path) -> None:
+        path = Path(path)
+        if not is_backup(path):
+            return
+        with self._lock:
+            stat = path.stat()
+            self._index_file(path)
+            self._signatures[path.name] = (stat.st_mtime_ns, stat.st_size)
+
+    def _index_file(self, path: Path) -> None:
+        key = path.name
+        self._drop(key)
+
+        lines = path.read_text(errors="replace").splitlines()
+        sections = split_sections(lines)
+        snapshot_tokens = set()
+
+        for line_no, line in enumerate(lines):
+            for token in _tokens(line):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    for gram in _grams(token):
+                        self._grams.setdefault(gram, set()).add(token)
+                postings.setdefault(key, []).append(line_no)
+                snapshot_tokens.add(token)
+
+        self._devices[key] = _device_from_path(path)
+        self._lines[key] = lines
+        self._sections[key] = sections
+        self._snapshot_tokens[key] = snapshot_tokens
+
+    def _drop(self, key: str) -> None:
+        for token in self._snapshot_tokens.pop(key, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                for gram in _grams(token):
+                    tokens = self._grams.get(gram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._grams[gram]
+        self._devices.pop(key, None)
+        self._lines.pop(key, None)
+        self._sections.pop(key, None)
+
+    def _containing(self, token: str) -> List[str]:
+        # Indexed tokens that contain the pattern token, found through the trigram side
+        # index; only tokens shorter than a trigram fall back to scanning the vocabulary.
+        if len(token) < GRAM:
+            return [indexed for indexed in self._postings if token in indexed and indexed != token]
+        gram_sets = sorted((self._grams.get(gram, set()) for gram in _grams(token)), key=len)
+        if not gram_sets[0]:
+            return []
+        candidates = gram_sets[0].intersection(*gram_sets[1:])
+        return [indexed for indexed in candidates if token in indexed and indexed != token]
+
+    def _lookup(self, token: str) -> Dict[str, Set[int]]:
+        # Exact token hit first, then every longer token containing it, so "loopback" also
+        # matches "loopback66070112".
+        merged: Dict[str, Set[int]] = {
+            key: set(line_nos) for key, line_nos in self._postings.get(token, {}).items()
+        }
+        for indexed_token in self._containing(token):
+            for key, line_nos in self._postings[indexed_token].items():
+                merged.setdefault(key, set()).update(line_nos)
+        return merged
+
+    def devices(self) -> List[str]:
+        return sorted(set(self._devices.values()))
+
+    def find(self, pattern: str, section: Optional[str] = None) -> List[Tuple[str, int, str]]:
+        needle = pattern.strip().lower()
+        tokens = _tokens(needle)
+        if not tokens:
+            return []
+
+        results = []
+
+        with self._lock:
+            # Rarest token first keeps the candidate set small before verifying substrings.
+            postings = sorted((self._lookup(token) for token in tokens), key=len)
+            first = postings[0]
+            for key in sorted(first, key=lambda key: (self._devices[key], key)):
+                candidates = first[key]
+                for other in postings[1:]:
+                    candidates = candidates & other.get(key, set())
+                    if not candidates:
+                        break
+
+                lines = self._lines[key]
+                sections = self._sections[key]
+                for line_no in sorted(candidates):
+                    if section and sections[line_no] != section:
+                        continue
+                    if needle in lines[line_no].lower():
+                        results.append((self._devices[key], line_no + 1, lines[line_no].strip()))
+
+        return results
+
+
+_index = ConfigIndex()
+
+
+def refresh() -> int:
+    return _index.refresh()
+
+
+def add_snapshot(path: Path) -> None:
+    _index.add_snapshot(path)
+
+
+def parse_query(query: str) -> Tuple[Optional[str], str]:
+    # "interfaces:Loopback66070112" restricts the match to one section.
+    head, sep, rest = query.strip().partition(":")
+    if sep and head.lower() in SECTIONS and rest.strip():
+        return head.lower(), rest.strip()
+    return None, query.strip()
+
+
+def find(query: str) -> str:
+    section, pattern = parse_query(query)
+    if not pattern:
+        return "Error: Pattern required for find command."
+
+    if _index.refreshed_at is None or time.monotonic() - _index.refreshed_at > REFRESH_INTERVAL:
+        refresh()
+    matches = _index.find(pattern, section)
+    if not matches:
+        return f"No match for '{pattern}' in stored configs."
+
+    devices = sorted({device for device, _, _ in matches})
+    lines = [f"{device}:{line_no} {text}" for device, line_no, text in matches[:MAX_RESULT_LINES]]
+    if len(matches) > MAX_RESULT_LINES:
+        lines.append(f"... {len(matches) - MAX_RESULT_LINES} more matches")
+
+    header = f"Found '{pattern}' on {len(devices)} device(s): {', '.join(devices)}"
+    return "\n".join([header] + lines)
@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+HISTORY_SIZE = int(os.getenv("INTERFACE_HISTORY_SIZE", "512"))
+SAMPLE_INTERVAL = float(os.getenv("INTERFACE_SAMPLE_INTERVAL", "30"))
+# gigabit_status only trusts a sample this recent; older data falls back to a live query.
+MAX_SAMPLE_AGE = float(os.getenv("INTERFACE_MAX_SAMPLE_AGE", str(SAMPLE_INTERVAL * 2)))
+
+STATES = ("up", "down", "administratively down", "unknown")
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+UNKNOWN = STATE_CODES["unknown"]
+log = logging.getLogger(__name__)
+
+
+class ChangeEvent(NamedTuple):
+    device: str
+    interface: str
+    old: str
+    new: str
+    timestamp: float
+
+
+class InterfaceRing:
+    # Fixed-size circular buffer of (timestamp, state code) in two flat arrays.
+    __slots__ = ("capacity", "times", "states", "head", "count")
+
+    def __init__(self, capacity: int = HISTORY_SIZE):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.states = array("B", bytes(capacity))
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp: float, state: int) -> None:
+        self.times[self.head] = timestamp
+        self.states[self.head] = state
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self) -> Optional[Tuple[float, int]]:
+        if not self.count:
+            return None
+        idx = (self.head - 1) % self.capacity
+        return self.times[idx], self.states[idx]
+
+    def __iter__(self):
+        # Oldest to newest.
+        start = (self.head - self.count) % self.capacity
+        for offset in range(self.count):
+            idx = (start + offset) % self.capacity
+            yield self.times[idx], self.states[idx]
+
+    def transitions(self, since: float = 0.0) -> int:
+        changes = 0
+        previous = None
+        for timestamp, state in self:
+            if previous is not None and state != previous and timestamp >= since:
+                changes += 1
+            previous = state
+        return changes
+
+
+class InterfaceHistory:
+    def __init__(self, capacity: int = HISTORY_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings: Dict[str, Dict[str, InterfaceRing]] = {}
+        self._sampled_at: Dict[str, float] = {}
+        self._listeners: List[Callable[[List[ChangeEvent]], None]] = []
+
+    def add_listener(self, callback: Callable[[List[ChangeEvent]], None]) -> None:
+        # Called with the change events of every record(), whether it came from the
+        # background sampler or an on-demand query.
+        self._listeners.append(callback)
+
+    def record(self, device: str, states: Iterable[Tuple[str, str]], timestamp: Optional[float] = None) -> List[ChangeEvent]:
+        timestamp = time.time() if timestamp is None else timestamp
+        events = []
+        with self._lock:
+            rings = self._rings.setdefault(device, {})
+            for interface, state in states:
+                code = STATE_CODES.get((state or "").lower(), UNKNOWN)
+                ring = rings.get(interface)
+                if ring is None:
+                    ring = rings[interface] = InterfaceRing(self.capacity)
+                previous = ring.latest()
+                if previous is not None and previous[1] != code:
+                    events.append(ChangeEvent(device, interface, STATES[previous[1]], STATES[code], timestamp))
+                ring.append(timestamp, code)
+            self._sampled_at[device] = timestamp
+        if events:
+            for callback in self._listeners:
+                try:
+                    callback(events)
+                except Exception as exc:
+                    log.warning("Interface change listener error: %s", exc)
+        return events
+
+    def latest(self, device: str, max_age: Optional[float] = MAX_SAMPLE_AGE) -> Optional[List[Tuple[str, str]]]:
+        with self._lock:
+            sampled_at = self._sampled_at.get(device)
+            if sampled_at is None or (max_age is not None and time.time() - sampled_at > max_age):
+                return None
+            rows = []
+            for interface, ring in self._rings.get(device, {}).items():
+                latest = ring.latest()
+                # Interfaces missing from the newest sample are no longer on the device.
+                if latest is not None and latest[0] == sampled_at:
+                    rows.append((interface, STATES[latest[1]]))
+            return rows
+
+    def flaps(self, device: str, window: float) -> Dict[str, int]:
+        since = time.time() - window
+        with self._lock:
+            return {
+                interface: ring.transitions(since)
+                for interface, ring in sorted(self._rings.get(device, {}).items())
+            }
+
+    def devices(self) -> List[str]:
+        with self._lock:
+            return sorted(self._rings)
+
+
+history = InterfaceHistory()
+
+
+class Sampler:
+    def __init__(
+        self,
+        devices: List[str],
+        fetch: Callable[[str], List[Tuple[str, str]]],
+        interval: float = SAMPLE_INTERVAL,
+        store: InterfaceHistory = history,
+    ):
+        self.devices = devices
+        self.fetch = fetch
+        self.interval = interval
+        self.store = store
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="interface-sampler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def sample_once(self) -> None:
+        for device in self.devices:
+            try:
+                states = self.fetch(device)
+            except Exception as exc:
+                log.warning("Interface sampler error for %s: %s", device, exc)
+                continue
+            # Change events reach subscribers through InterfaceHistory.add_listener.
+            self.store.record(device, states)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.sample_once()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+def format_events(events: List[ChangeEvent]) -> str:
+    return "\n".join(
+        f"{time.strftime('%H:%M:%S', time.localtime(event.timestamp))} {event.device} "
+        f"{event.interface}: {event.old} -> {event.new}"
+        for event in events
+    )
+
+
+def format_flaps(device: str, window: float, counts: Dict[str, int]) -> str:
+    minutes = window / 60
+    if not counts:
+        return f"No interface history for {device}."
+    parts = [f"{interface} {count}" for interface, count in counts.items()]
+    return f"Flaps on {device} in the last {minutes:g} min: " + ", ".join(parts)
@@ -5,21 +5,31 @@
 
 #######################################################################################
 # 1. Import libraries for API requests, JSON formatting, time, os, (restconf_final or netconf_final), netmiko_final, and ansible_final.
-import requests
+import logging
 import os
-import time
-import json
+import threading
 import ipaddress
 import restconf_final
 import netconf_final
 import netmiko_final
 import ansible_final
+import config_index
+import worker_pool
+import webex_client
+import reply_queue
+import room_scheduler
+import provisioning
+import reconcile
+import interface_history
+import bot_logging
 
 #######################################################################################
 # 2. Assign the Webex access token to the variable ACCESS_TOKEN using environment variables.
 
 ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-last_method = None
+log = logging.getLogger("ipa2024_final")
+# last RESTCONF/NETCONF method chosen, remembered per (room, student ID)
+last_methods = {}
 
 # print("Current working directory:", os.getcwd())
 # print("ACCESS_TOKEN value:", repr(ACCESS_TOKEN))
@@ -29,136 +39,175 @@ last_method = None
 
 # Defines a variable that will hold the roomId
 roomIdToGetMessages = (os.getenv("roomIdToGetMessages"))
+# One process serves every room in ROOMS ("roomA;roomB:66070001-66070040"),
+# defaulting to the single roomIdToGetMessages.
+rooms = room_scheduler.parse_rooms(os.getenv("ROOMS") or roomIdToGetMessages or "")
+rooms_by_id = {room.room_id: room for room in rooms}
 
 
-while True:
-    # always add 1 second of delay to the loop to not go over a rate limit of API calls
-    time.sleep(1)
-
-    # the Webex Teams GET parameters
-    #  "roomId" is the ID of the selected room
-    #  "max": 1  limits to get only the very last message in the room
-    getParameters = {"roomId": roomIdToGetMessages, "max": 1}
-
-    # the Webex Teams HTTP header, including the Authoriztion
-    getHTTPHeader = {"Authorization": "Bearer " + ACCESS_TOKEN}
-
-# 4. Provide the URL to the Webex Teams messages API, and extract location from the received message.
-    
-    # Send a GET request to the Webex Teams messages API.
-    # - Use the GetParameters to get only the latest message.
-    # - Store the message in the "r" variable.
-    r = requests.get(
-        "https://webexapis.com/v1/messages",
-        params=getParameters,
-        headers=getHTTPHeader,
-    )
-    # verify if the retuned HTTP status code is 200/OK
-    print("Response status code:", r.status_code)
-    print("Response headers:", dict(r.headers))
-    print("Response text:", r.text)
-    
-    if not r.status_code == 200:
-        raise Exception(
-            "Incorrect reply from Webex Teams API. Status code: {}. Response: {}".format(r.status_code, r.text)
-        )
-
-    # get the JSON formatted returned data
-    json_data = r.json()
-
-    # check if there are any messages in the "items" array
-    if len(json_data["items"]) == 0:
-        raise Exception("There are no messages in the room.")
-
-    # store the array of messages
-    messages = json_data["items"]
-    
-    # store the text of the first message in the array
-    message = messages[0]["text"]
-    print("Received message: " + message)
-
-    # check if the text of the message starts with the magic character "/" followed by your studentID and a space and followed by a command name
-    #  e.g.  "/66070123 create"
-    if message.startswith("/" + "66070112" + " "):
-
-        # extract the command
-        command = message[len("66070112") + 2:]
-        print(command)
-
+#######################################################################################
 # 5. Complete the logic for each command
 
-        attachment_path = None
-        responseMessage = None
-        tokens = command.strip().split()
+def _is_ipv4(token):
+    try:
+        ipaddress.IPv4Address(token)
+    except ipaddress.AddressValueError:
+        return False
+    return True
+
+
+def _bulk(method, ip, tokens, scope=None):
+    if not ip:
+        return "Error: No IP specified."
+    if not tokens or tokens[0].lower() not in provisioning.ACTIONS:
+        return "Error: Bulk action must be one of create, delete, enable, disable."
+    try:
+        student_ids = provisioning.parse_id_spec(tokens[1:], scope=scope)
+    except ValueError as exc:
+        return f"Error: {exc}"
+    if not student_ids:
+        return "Error: No student IDs given for bulk command."
+
+    transport = restconf_final if method == "restconf" else netconf_final
+    return transport.bulk(tokens[0].lower(), ip, student_ids)
+
+
+def handle_command(command, student_id=provisioning.DEFAULT_STUDENT_ID, room_id=None):
+    attachment_path = None
+    responseMessage = None
+    tokens = command.strip().split()
+    # Bulk commands may only touch the student IDs served by the room that sent them.
+    room = rooms_by_id.get(room_id)
+    scope = room.allowed_ids() if room else None
+
+    if not tokens:
+        responseMessage = "Error: No command provided."
+    else:
+        special_commands = {"showrun", "gigabit_status", "motd", "find", "metrics", "flaps"}
+
+        action = None
+        action_index = None
+        for idx, token in enumerate(tokens):
+            if token.lower() in special_commands:
+                action = token.lower()
+                action_index = idx
+                break
+
+        handled_special = False
+
+        if action in special_commands:
+            handled_special = True
+            ip = None
+            remaining_tokens = []
 
-        if not tokens:
-            responseMessage = "Error: No command provided."
-        else:
-            special_commands = {"showrun", "gigabit_status", "motd"}
-
-            action = None
-            action_index = None
             for idx, token in enumerate(tokens):
-                if token.lower() in special_commands:
-                    action = token.lower()
-                    action_index = idx
-                    break
-
-            handled_special = False
-
-            if action in special_commands:
-                handled_special = True
-                ip = None
-                remaining_tokens = []
-
-                for idx, token in enumerate(tokens):
-                    if idx == action_index:
-                        continue
-
-                    if ip is None:
-                        try:
-                            ipaddress.IPv4Address(token)
-                        except ipaddress.AddressValueError:
-                            remaining_tokens.append(token)
-                        else:
-                            ip = token
-                        continue
-
-                    remaining_tokens.append(token)
-
-                if action == "gigabit_status":
-                    responseMessage = netmiko_final.gigabit_status()
-                elif action == "showrun":
-                    if not ip:
-                        responseMessage = "Error: IP address required for showrun command."
-                    elif remaining_tokens:
-                        responseMessage = "Error: Unexpected arguments for showrun command."
-                    else:
-                        showrun_result = ansible_final.showrun(ip)
-                        responseMessage = showrun_result.get("message", "")
-                        if showrun_result.get("success"):
-                            attachment_path = showrun_result.get("file_path")
-                elif action == "motd":
-                    if not ip:
-                        responseMessage = "Error: IP address required for motd command."
+                if idx == action_index:
+                    continue
+
+                if ip is None:
+                    try:
+                        ipaddress.IPv4Address(token)
+                    except ipaddress.AddressValueError:
+                        remaining_tokens.append(token)
                     else:
-                        motd_tokens = [token for token in remaining_tokens if token != ip]
-                        motd_text = " ".join(motd_tokens).strip()
-                        motd_result = ansible_final.motd(ip, motd_text or None)
-                        responseMessage = motd_result.get("message", "")
-
-            if not handled_special:
-                tokens_copy = tokens[:]
-                ip = None
-                method = None
-
-                if tokens_copy and tokens_copy[0].lower() in {"restconf", "netconf"}:
-                    method = tokens_copy.pop(0).lower()
-                    last_method = method
-                else:
-                    method = last_method
+                        ip = token
+                    continue
 
-                if tokens_copy:
+                remaining_tokens.append(token)
+
+            if action == "metrics":
+                stats = replies.stats()
+                responseMessage = (
+                    f"Commands: {stats['commands']}, Webex API calls: {stats['api_calls']} "
+                    f"({stats['api_calls_per_command']} per command), "
+                    f"coalesced: {stats['messages_coalesced']}, failed: {stats['failed_calls']}, "
+                    f"queued jobs: {pool.pending()}, hung workers: {pool.abandoned()}"
+                )
+                responseMessage += "\nRooms: " + ", ".join(
+                    f"{label} {room['running']} running/{room['queued']} queued/{room['rejected']} rejected"
+                    for label, room in scheduler.stats().items()
+                )
+                changes = reconcile.stats()
+                responseMessage += (
+                    f"\nDevice changes: {changes['writes_sent']} sent, {changes['writes_skipped']} no-op, "
+                    f"{changes['fetches']} state reads, {changes['cache_hits']} cache hits, "
+                    f"round trips saved: {changes['round_trips_saved']}"
+                )
+            elif action == "find":
+                # The pattern may itself contain IPs or command words, so take it verbatim.
+                responseMessage = config_index.find(" ".join(tokens[action_index + 1:]))
+            elif action == "gigabit_status":
+                _watch_device(ip or netmiko_final.device_ip, room_id)
+                responseMessage = netmiko_final.gigabit_status(ip)
+            elif action == "flaps":
+                # "flaps [ip] [minutes]", default the last 60 minutes of the sampled device
+                device = ip or netmiko_final.device_ip
+                _watch_device(device, room_id)
+                minutes = remaining_tokens[0] if remaining_tokens else "60"
+                try:
+                    window = float(minutes) * 60
+                except ValueError:
+                    responseMessage = "Error: Window for flaps must be a number of minutes."
+                else:
+                    counts = interface_history.history.flaps(device, window)
+                    responseMessage = interface_history.format_flaps(device, window, counts)
+            elif action == "showrun":
+                if not ip:
+                    responseMessage = "Error: IP address required for showrun command."
+                elif not all(_is_ipv4(token) for token in remaining_tokens):
+                    responseMessage = "Error: Unexpected arguments for showrun command."
+                elif remaining_tokens:
+                    # "showrun <ip> <ip> ..." bundles every device's backup into one attachment.
+                    showrun_result = ansible_final.showrun_many([ip] + remaining_tokens)
+                    responseMessage = showrun_result.get("message", "")
+                    if showrun_result.get("success"):
+                        attachment_path = showrun_result.get("file_paths")
+                        for file_path in attachment_path:
+                            config_index.add_snapshot(file_path)
+                else:
+                    showrun_result = ansible_final.showrun(ip)
+                    responseMessage = showrun_result.get("message", "")
+                    if showrun_result.get("success"):
+                        attachment_path = showrun_result.get("file_path")
+                        config_index.add_snapshot(attachment_path)
+            elif action == "motd":
+                if not ip:
+                    responseMessage = "Error: IP address required for motd command."
+                else:
+                    motd_tokens = [token for token in remaining_tokens if token != ip]
+                    motd_text = " ".join(motd_tokens).strip()
+                    motd_result = ansible_final.motd(ip, motd_text or None)
+                    responseMessage = motd_result.get("message", "")
+
+        if not handled_special:
+            tokens_copy = tokens[:]
+            ip = None
+            method = None
+
+            if tokens_copy and tokens_copy[0].lower() in {"restconf", "netconf"}:
+                method = tokens_copy.pop(0).lower()
+                last_methods[(room_id, student_id)] = method
+            else:
+                method = last_methods.get((room_id, student_id))
+
+            if tokens_copy:
+                try:
+                    ipaddress.IPv4Address(tokens_copy[0])
+                except ipaddress.AddressValueError:
+                    pass
+                else:
+                    ip = tokens_copy.pop(0)
+
+            if method is None and tokens_copy and tokens_copy[0].lower() in {"restconf", "netconf"}:
+                method = tokens_copy.pop(0).lower()
+                last_methods[(room_id, student_id)] = method
+
+            if method and not tokens_copy and ip is None:
+                responseMessage = f"Ok: {method}"
+            elif method is None:
+                responseMessage = "Error: No method is specified."
+            else:
+                if ip is None and tokens_copy:
                     try:
                         ipaddress.IPv4Address(tokens_copy[0])
                     except ipaddress.AddressValueError:
@@ -166,130 +215,179 @@ while True:
                     else:
                         ip = tokens_copy.pop(0)
 
-                if method is None and tokens_copy and tokens_copy[0].lower() in {"restconf", "netconf"}:
-                    method = tokens_copy.pop(0).lower()
-                    last_method = method
-
-                if method and not tokens_copy and ip is None:
-                    responseMessage = f"Ok: {method}"
-                elif method is None:
-                    responseMessage = "Error: No method is specified."
+                if not tokens_copy:
+                    responseMessage = "Error: No command provided."
                 else:
-                    if ip is None and tokens_copy:
-                        try:
-                            ipaddress.IPv4Address(tokens_copy[0])
-                        except ipaddress.AddressValueError:
-                            pass
-                        else:
-                            ip = tokens_copy.pop(0)
-
-                    if not tokens_copy:
-                        responseMessage = "Error: No command provided."
-                    else:
-                        action = tokens_copy.pop(0).lower()
-
-                        restconf_actions = {"create", "delete", "enable", "disable", "status"}
-                        netconf_actions = restconf_actions
-
-                        if method == "restconf":
-                            if action in restconf_actions:
-                                if not ip:
-                                    responseMessage = "Error: No IP specified."
-                                else:
-                                    restconf_final.api_url = f"https://{ip}/restconf/"
-                                    print(f"Set api_url to: {restconf_final.api_url}")
-                                    if action == "create":
-                                        responseMessage = restconf_final.create()
-                                    elif action == "delete":
-                                        responseMessage = restconf_final.delete()
-                                    elif action == "enable":
-                                        responseMessage = restconf_final.enable()
-                                    elif action == "disable":
-                                        responseMessage = restconf_final.disable()
-                                    elif action == "status":
-                                        responseMessage = restconf_final.status()
+                    action = tokens_copy.pop(0).lower()
+
+                    restconf_actions = {"create", "delete", "enable", "disable", "status"}
+                    netconf_actions = restconf_actions
+
+                    if action == "bulk":
+                        # "bulk <create|delete|enable|disable> <ids|from-to|all>"
+                        responseMessage = _bulk(method, ip, tokens_copy, scope)
+                    elif method == "restconf":
+                        if action in restconf_actions:
+                            if not ip:
+                                responseMessage = "Error: No IP specified."
                             else:
-                                responseMessage = "Error: No command or unknown command"
-                        elif method == "netconf":
-                            if action in netconf_actions:
-                                if not ip:
-                                    responseMessage = "Error: No IP specified."
-                                else:
-                                    if action == "create":
-                                        responseMessage = netconf_final.create(ip)
-                                    elif action == "delete":
-                                        responseMessage = netconf_final.delete(ip)
-                                    elif action == "enable":
-                                        responseMessage = netconf_final.enable(ip)
-                                    elif action == "disable":
-                                        responseMessage = netconf_final.disable(ip)
-                                    elif action == "status":
-                                        responseMessage = netconf_final.status(ip)
+                                log.debug("Using RESTCONF target: https://%s/restconf/", ip)
+                                if action == "create":
+                                    responseMessage = restconf_final.create(ip, student_id)
+                                elif action == "delete":
+                                    responseMessage = restconf_final.delete(ip, student_id)
+                                elif action == "enable":
+                                    responseMessage = restconf_final.enable(ip, student_id)
+                                elif action == "disable":
+                                    responseMessage = restconf_final.disable(ip, student_id)
+                                elif action == "status":
+                                    responseMessage = restconf_final.status(ip, student_id)
+                        else:
+                            responseMessage = "Error: No command or unknown command"
+                    elif method == "netconf":
+                        if action in netconf_actions:
+                            if not ip:
+                                responseMessage = "Error: No IP specified."
                             else:
-                                responseMessage = "Error: No command or unknown command"
+                                if action == "create":
+                                    responseMessage = netconf_final.create(ip, student_id)
+                                elif action == "delete":
+                                    responseMessage = netconf_final.delete(ip, student_id)
+                                elif action == "enable":
+                                    responseMessage = netconf_final.enable(ip, student_id)
+                                elif action == "disable":
+                                    responseMessage = netconf_final.disable(ip, student_id)
+                                elif action == "status":
+                                    responseMessage = netconf_final.status(ip, student_id)
+                        else:
+                            responseMessage = "Error: No command or unknown command"
 
-            if responseMessage is None:
-                responseMessage = "Error: Unable to process command."
-        
-# 6. Complete the code to post the message to the Webex Teams room.
+        if responseMessage is None:
+            responseMessage = "Error: Unable to process command."
 
-        # The Webex Teams POST JSON data for command showrun
-        # - "roomId" is is ID of the selected room
-        # - "text": is always "show running config"
-        # - "files": is a tuple of filename, fileobject, and filetype.
+    return responseMessage, attachment_path
 
-        # the Webex Teams HTTP headers, including the Authoriztion and Content-Type
-        
-        # Prepare postData and HTTPHeaders for command showrun
-        # Need to attach file if responseMessage is 'ok'; 
-        # Read Send a Message with Attachments Local File Attachments
-        # https://developer.webex.com/docs/basics for more detail
 
-        if attachment_path:
-            if not os.path.exists(attachment_path):
-                responseMessage = (
-                    responseMessage
-                    + "\nAttachment missing on controller."
-                    if responseMessage
-                    else "Attachment missing on controller."
-                )
-                attachment_path = None
-
-        if attachment_path:
-            with open(attachment_path, "rb") as attachment_file:
-                data = {
-                    "roomId": roomIdToGetMessages,
-                    "text": responseMessage or "Ansible backup completed successfully.",
-                }
-                files = {
-                    "files": (
-                        os.path.basename(attachment_path),
-                        attachment_file,
-                        "text/plain",
-                    )
-                }
-                HTTPHeaders = {"Authorization": "Bearer " + ACCESS_TOKEN}
-                r = requests.post(
-                    "https://webexapis.com/v1/messages",
-                    data=data,
-                    files=files,
-                    headers=HTTPHeaders,
-                )
-        else:
-            postData = {"roomId": roomIdToGetMessages, "text": responseMessage}
-            postData = json.dumps(postData)
-
-            HTTPHeaders = {
-                "Authorization": "Bearer " + ACCESS_TOKEN,
-                "Content-Type": "application/json"
-            }
-
-            r = requests.post(
-                "https://webexapis.com/v1/messages",
-                data=postData,
-                headers=HTTPHeaders,
-            )
-        if not r.status_code == 200:
-            raise Exception(
-                "Incorrect reply from Webex Teams API. Status code: {}".format(r.status_code)
+#######################################################################################
+# 6. Complete the code to post the message to the Webex Teams room.
+
+def post_message(responseMessage, attachment_path=None, requester=None, label=None, room_id=None, command=False):
+    # The Webex Teams POST JSON data for command showrun
+    # - "roomId" is is ID of the selected room
+    # - "text": is always "show running config"
+    # - "files": is a tuple of filename, fileobject, and filetype.
+
+    # the Webex Teams HTTP headers, including the Authoriztion and Content-Type
+    
+    # Prepare postData and HTTPHeaders for command showrun
+    # Need to attach file if responseMessage is 'ok'; 
+    # Read Send a Message with Attachments Local File Attachments
+    # https://developer.webex.com/docs/basics for more detail
+
+    attachment_paths = []
+    if attachment_path:
+        attachment_paths = attachment_path if isinstance(attachment_path, list) else [attachment_path]
+        attachment_paths, missing = webex_client.existing_attachments(attachment_paths)
+        if missing:
+            responseMessage = (
+                responseMessage
+                + "\nAttachment missing on controller."
+                if responseMessage
+                else "Attachment missing on controller."
             )
+
+    # Replies are queued and posted in the background on a shared connection;
+    # text replies to the same requester within a short window go out as one message.
+    # Attachments are streamed from disk (optionally gzip/zip bundled).
+    replies.put(
+        room_id or rooms[0].room_id,
+        responseMessage or ("Ansible backup completed successfully." if attachment_paths else ""),
+        requester=requester,
+        attachments=attachment_paths or None,
+        label=label,
+        command=command,
+    )
+
+
+def _reply_when_done(job, requester=None, label=None, room_id=None):
+    try:
+        responseMessage, attachment_path = job.result()
+    except worker_pool.JobTimeoutError:
+        responseMessage, attachment_path = "Error: Command timed out.", None
+    except worker_pool.JobCancelledError:
+        responseMessage, attachment_path = "Error: Command cancelled.", None
+    except Exception as exc:
+        log.exception("Command job %s failed: %s", job.id, exc)
+        responseMessage, attachment_path = "Error: Unable to process command.", None
+
+    try:
+        post_message(responseMessage, attachment_path, requester, label, room_id, command=True)
+    except Exception as exc:
+        log.warning("Webex reply for job %s failed: %s", job.id, exc)
+
+
+#######################################################################################
+# 4. Provide the URL to the Webex Teams messages API, and extract location from the received message.
+
+bot_logging.setup()
+log.info("Indexed %s config snapshots", config_index.refresh())
+pool = worker_pool.get_pool()
+replies = reply_queue.ReplyQueue(ACCESS_TOKEN)
+
+
+# Interface change events go to INTERFACE_EVENT_ROOMS when set. Otherwise they only go
+# to the rooms that asked about that device (or the single room, if there is just one),
+# so one tenant's router is not reported into every other tenant's room.
+event_rooms = [room for room in os.getenv("INTERFACE_EVENT_ROOMS", "").split(";") if room]
+device_rooms = {}
+device_rooms_lock = threading.Lock()
+
+
+def _watch_device(device, room_id):
+    if device and room_id:
+        with device_rooms_lock:
+            device_rooms.setdefault(device, set()).add(room_id)
+
+
+def _event_rooms(device):
+    if event_rooms:
+        return event_rooms
+    if len(rooms) == 1:
+        return [rooms[0].room_id]
+    with device_rooms_lock:
+        return sorted(device_rooms.get(device, ()))
+
+
+def _post_interface_changes(events):
+    by_device = {}
+    for event in events:
+        by_device.setdefault(event.device, []).append(event)
+    for device, device_events in by_device.items():
+        text = "Interface change:\n" + interface_history.format_events(device_events)
+        for room_id in _event_rooms(device):
+            replies.put(room_id, text)
+
+
+# Background sampler keeps a short interface state history per device and reports flaps.
+sampled_devices = [ip for ip in os.getenv("SAMPLER_DEVICES", netmiko_final.device_ip or "").split(",") if ip]
+# Changes seen by the sampler and by on-demand gigabit_status queries are posted alike.
+interface_history.history.add_listener(_post_interface_changes)
+if sampled_devices:
+    interface_history.Sampler(sampled_devices, netmiko_final.interface_states).start()
+
+# Every room is polled from one scheduler; commands wait in fair per-room queues and
+# each room may only hold ROOM_CONCURRENCY workers of the shared pool at a time.
+scheduler = room_scheduler.RoomScheduler(
+    ACCESS_TOKEN,
+    rooms,
+    handle_command,
+    lambda item, job: _reply_when_done(job, item.requester, item.command, item.room_id),
+    lambda item, text: post_message(
+        text,
+        requester=item.requester,
+        label=item.command,
+        room_id=item.room_id,
+    ),
+    pool=pool,
+)
+scheduler.run()
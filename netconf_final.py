@@ -1,24 +1,36 @@
+import atexit
+import logging
 import os
-from contextlib import contextmanager
-from typing import Optional
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Optional, Tuple
 
 from ncclient import manager
-import xmltodict
+from ncclient.operations import RaiseMode
+
+import bot_logging
+import netconf_xml
+import provisioning
+import reconcile
 
 
 netconf_host = ""
 NETCONF_PORT = 830
 NETCONF_USERNAME = os.getenv("userNAME")
 NETCONF_PASSWORD = os.getenv("passWORD")
+STUDENT_ID = provisioning.DEFAULT_STUDENT_ID
+# Idle sessions kept open per router, and how long an idle one may be reused.
+NETCONF_POOL_SIZE = int(os.getenv("NETCONF_POOL_SIZE", "2"))
+NETCONF_IDLE_TIMEOUT = float(os.getenv("NETCONF_IDLE_TIMEOUT", "60"))
+log = logging.getLogger(__name__)
 
+_idle_lock = threading.Lock()
+_idle: Dict[str, List[Tuple[manager.Manager, float]]] = {}
 
-@contextmanager
-def _connect(host: Optional[str] = None):
-    target_host = host or netconf_host
-    if not target_host:
-        raise ValueError("NETCONF host is not specified.")
 
-    with manager.connect(
+def _open(target_host: str):
+    connection = manager.connect(
         host=target_host,
         port=NETCONF_PORT,
         username=NETCONF_USERNAME,
@@ -27,150 +39,239 @@ def _connect(host: Optional[str] = None):
         allow_agent=False,
         look_for_keys=False,
         timeout=30,
-    ) as connection:
+    )
+    # Warning-only rpc-errors come back as replies and are judged by netconf_xml.reply_ok.
+    connection.raise_mode = RaiseMode.ERRORS
+    return connection
+
+
+def _close(connection) -> None:
+    try:
+        connection.close_session()
+    except Exception as exc:
+        log.debug("NETCONF close error: %s", exc)
+
+
+@contextmanager
+def _connect(host: Optional[str] = None):
+    target_host = host or netconf_host
+    if not target_host:
+        raise ValueError("NETCONF host is not specified.")
+
+    # Sessions are checked out of a per-host idle pool shared by every room and
+    # worker, so back-to-back commands skip the SSH handshake and NETCONF hello.
+    connection = None
+    stale = []
+    with _idle_lock:
+        idle = _idle.get(target_host, [])
+        while idle and connection is None:
+            candidate, released = idle.pop()
+            if candidate.connected and time.monotonic() - released < NETCONF_IDLE_TIMEOUT:
+                connection = candidate
+            else:
+                stale.append(candidate)
+    for candidate in stale:
+        _close(candidate)
+    if connection is None:
+        connection = _open(target_host)
+
+    try:
         yield connection
+    except BaseException:
+        # The session may be mid-RPC or broken; never hand it to another job.
+        _close(connection)
+        raise
+
+    with _idle_lock:
+        idle = _idle.setdefault(target_host, [])
+        if connection.connected and len(idle) < NETCONF_POOL_SIZE:
+            idle.append((connection, time.monotonic()))
+            connection = None
+    if connection is not None:
+        _close(connection)
 
 
-def create(host: Optional[str] = None):
-    netconf_config = """
-<config>
-  <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-    <interface>
-      <name>Loopback66070112</name>
-      <description>Created via NETCONF</description>
-      <type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>
-      <enabled>true</enabled>
-      <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">
-        <address>
-          <ip>172.1.12.1</ip>
-          <netmask>255.255.255.0</netmask>
-        </address>
-      </ipv4>
-    </interface>
-  </interfaces>
-</config>
-"""
+def close_idle() -> None:
+    with _idle_lock:
+        sessions = [connection for idle in _idle.values() for connection, _ in idle]
+        _idle.clear()
+    for connection in sessions:
+        _close(connection)
+
+
+atexit.register(close_idle)
+
+
+@contextmanager
+def _lazy_connect(host: Optional[str] = None):
+    # Yields a getter that opens the session on first use, so a change that the
+    # reconcile cache already knows is a no-op never touches the device.
+    with ExitStack() as stack:
+        session = []
+
+        def connection():
+            if not session:
+                session.append(stack.enter_context(_connect(host)))
+            return session[0]
 
+        yield connection
+
+
+def running_state(connection, spec: provisioning.LoopbackSpec):
+    reply = connection.get_config(source="running", filter=provisioning.netconf_config_filter(spec))
+    return netconf_xml.interface_state(reply.data_ele, spec.name)
+
+
+def running_states(connection):
+    reply = connection.get_config(source="running", filter=provisioning.netconf_config_filter())
+    return netconf_xml.interface_states(reply.data_ele)
+
+
+def _edit_ok(reply, host: Optional[str]) -> bool:
+    # edit-config replies are a few hundred bytes, so parsing the public reply.xml
+    # once is cheap and keeps the rpc-error judgement in netconf_xml.
+    root = netconf_xml.parse(reply.xml)
+    for error in netconf_xml.reply_errors(root):
+        log.warning("NETCONF rpc-error on %s: %s %s %s", host, error.severity, error.tag, error.message)
+    return netconf_xml.reply_ok(root)
+
+
+def _reconciled_edit(action: str, host: Optional[str], student_id: str):
+    # Returns (plan, ok); ok is None when the plan needs no edit-config.
+    spec = provisioning.loopback_for(student_id)
+    with _lazy_connect(host) as connection:
+        plan = reconcile.plan(action, host, spec, lambda _host, spec: running_state(connection(), spec))
+        if plan.noop:
+            return plan, None
+        netconf_config = provisioning.netconf_changes([(change, spec) for change in plan.changes])
+        bot_logging.log_payload(log, "NETCONF edit-config", netconf_config, host=host)
+        try:
+            reply = connection().edit_config(target="running", config=netconf_config)
+        except Exception:
+            reconcile.applied(host, plan, False)
+            raise
+    bot_logging.log_payload(log, "NETCONF edit-config reply", reply.xml, host=host)
+    ok = _edit_ok(reply, host)
+    reconcile.applied(host, plan, ok)
+    return plan, ok
+
+
+def create(host: Optional[str] = None, student_id: str = STUDENT_ID):
     try:
-        with _connect(host) as connection:
-            reply = connection.edit_config(target="running", config=netconf_config)
-        print(reply.xml)
-        if "<ok/>" in reply.xml:
-            return "Interface 66070112 created successfully by using Netconf."
+        plan, ok = _reconciled_edit("create", host, student_id)
+        if ok is None:
+            return f"Cannot create: Interface loopback {student_id} : Interface {student_id} already exists."
+        if ok and plan.changes == ("address",):
+            return (
+                f"Interface loopback {student_id} already exists, address updated to "
+                f"{plan.spec.ip}/{plan.spec.netmask} by using Netconf."
+            )
+        if ok:
+            return f"Interface {student_id} created successfully by using Netconf."
         return "Create failed using Netconf."
     except Exception as exc:
-        print(f"NETCONF create error: {exc}")
+        log.warning("NETCONF create error: %s", exc)
         return "Create failed using Netconf."
 
 
-def delete(host: Optional[str] = None):
-    netconf_config = """
-<config>
-  <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-    <interface xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0" nc:operation="delete">
-      <name>Loopback66070112</name>
-    </interface>
-  </interfaces>
-</config>
-"""
-
+def delete(host: Optional[str] = None, student_id: str = STUDENT_ID):
     try:
-        with _connect(host) as connection:
-            reply = connection.edit_config(target="running", config=netconf_config)
-        print(reply.xml)
-        if "<ok/>" in reply.xml:
-            return "Interface Loopback 66070112 deleted successfully using Netconf."
-        return "Cannot delete: Interface loopback 66070112 using Netconf."
+        plan, ok = _reconciled_edit("delete", host, student_id)
+        if ok is None:
+            return f"Cannot delete: Interface loopback {student_id} using Netconf."
+        if ok:
+            return f"Interface Loopback {student_id} deleted successfully using Netconf."
+        return f"Cannot delete: Interface loopback {student_id} using Netconf."
     except Exception as exc:
-        print(f"NETCONF delete error: {exc}")
-        return "Cannot delete: Interface loopback 66070112 using Netconf."
-
-
-def enable(host: Optional[str] = None):
-    netconf_config = """
-<config>
-  <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-    <interface>
-      <name>Loopback66070112</name>
-      <enabled>true</enabled>
-    </interface>
-  </interfaces>
-</config>
-"""
+        log.warning("NETCONF delete error: %s", exc)
+        return f"Cannot delete: Interface loopback {student_id} using Netconf."
+
 
+def enable(host: Optional[str] = None, student_id: str = STUDENT_ID):
     try:
-        with _connect(host) as connection:
-            reply = connection.edit_config(target="running", config=netconf_config)
-        print(reply.xml)
-        if "<ok/>" in reply.xml:
-            return "Interface loopback 66070112 enabled successfully (check by Netconf)."
-        return "Cannot enable : Interface loopback 66070112 (check by Netconf)."
+        plan, ok = _reconciled_edit("enable", host, student_id)
+        if ok is None and plan.skip_reason == "missing":
+            return f"Cannot enable : Interface loopback {student_id} (check by Netconf)."
+        if ok is None:
+            return f"Interface loopback {student_id} is already enabled, no change sent (check by Netconf)."
+        if ok:
+            return f"Interface loopback {student_id} enabled successfully (check by Netconf)."
+        return f"Cannot enable : Interface loopback {student_id} (check by Netconf)."
     except Exception as exc:
-        print(f"NETCONF enable error: {exc}")
-        return "Cannot enable : Interface loopback 66070112 (check by Netconf)."
-
-
-def disable(host: Optional[str] = None):
-    netconf_config = """
-<config>
-  <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-    <interface>
-      <name>Loopback66070112</name>
-      <enabled>false</enabled>
-    </interface>
-  </interfaces>
-</config>
-"""
+        log.warning("NETCONF enable error: %s", exc)
+        return f"Cannot enable : Interface loopback {student_id} (check by Netconf)."
+
 
+def disable(host: Optional[str] = None, student_id: str = STUDENT_ID):
     try:
-        with _connect(host) as connection:
-            reply = connection.edit_config(target="running", config=netconf_config)
-        print(reply.xml)
-        if "<ok/>" in reply.xml:
-            return "Interface loopback 66070112 shutdowned successfully (check by Netconf)."
-        return "Cannot shutdown : Interface loopback 66070112 (check by Netconf)."
+        plan, ok = _reconciled_edit("disable", host, student_id)
+        if ok is None and plan.skip_reason == "missing":
+            return f"Cannot shutdown : Interface loopback {student_id} (check by Netconf)."
+        if ok is None:
+            return f"Interface loopback {student_id} is already shutdown, no change sent (check by Netconf)."
+        if ok:
+            return f"Interface loopback {student_id} shutdowned successfully (check by Netconf)."
+        return f"Cannot shutdown : Interface loopback {student_id} (check by Netconf)."
     except Exception as exc:
-        print(f"NETCONF disable error: {exc}")
-        return "Cannot shutdown : Interface loopback 66070112 (check by Netconf)."
+        log.warning("NETCONF disable error: %s", exc)
+        return f"Cannot shutdown : Interface loopback {student_id} (check by Netconf)."
 
 
-def status(host: Optional[str] = None):
-    netconf_filter = """
-<filter>
-  <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-    <interface>
-      <name>Loopback66070112</name>
-    </interface>
-  </interfaces-state>
-</filter>
-"""
+def status(host: Optional[str] = None, student_id: str = STUDENT_ID):
+    spec = provisioning.loopback_for(student_id)
+    netconf_filter = provisioning.netconf_status_filter(spec)
 
     try:
         with _connect(host) as connection:
             reply = connection.get(filter=netconf_filter)
-        print(reply.xml)
-        reply_dict = xmltodict.parse(reply.xml)
+        bot_logging.log_payload(log, "NETCONF get reply", reply.xml, host=host)
+        interface_status = netconf_xml.interface_status(reply.data_ele, spec.name)
 
-        interfaces_state = reply_dict.get("rpc-reply", {}).get("data", {}).get("interfaces-state", {})
-        interface = interfaces_state.get("interface")
+        if interface_status is None:
+            return f"No Interface loopback {student_id} (check by Netconf)."
 
-        if not interface:
-            return "No Interface loopback 66070112 (check by Netconf)."
+        admin_status, oper_status = interface_status
 
-        if isinstance(interface, list):
-            interface = next((item for item in interface if item.get("name") == "Loopback66070112"), None)
+        if admin_status == "up" and oper_status == "up":
+            return f"Interface loopback {student_id} is currently enabled (check by Netconf)."
+        if admin_status == "down" and oper_status == "down":
+            return f"Interface loopback {student_id} is currently disabled (check by Netconf)."
+        return f"Cannot get status : Interface loopback {student_id} (check by Netconf)."
+    except Exception as exc:
+        log.warning("NETCONF status error: %s", exc)
+        return f"Cannot get status : Interface loopback {student_id} (check by Netconf)."
 
-        if not interface:
-            return "No Interface loopback 66070112 (check by Netconf)."
 
-        admin_status = interface.get("admin-status")
-        oper_status = interface.get("oper-status")
+def bulk(action: str, host: Optional[str], student_ids: List[str]):
+    # Only loopbacks whose running state differs go into a single edit-config on one
+    # session; "remove" keeps a bulk delete from failing as a whole on a stale read.
+    specs = [provisioning.loopback_for(student_id) for student_id in student_ids]
+    start = time.perf_counter()
 
-        if admin_status == "up" and oper_status == "up":
-            return "Interface loopback 66070112 is currently enabled (check by Netconf)."
-        if admin_status == "down" and oper_status == "down":
-            return "Interface loopback 66070112 is currently disabled (check by Netconf)."
-        return "Cannot get status : Interface loopback 66070112 (check by Netconf)."
+    try:
+        with _connect(host) as connection:
+            plans = reconcile.plan_bulk(action, host, specs, lambda _host: running_states(connection))
+            pending = [plan for plan in plans if not plan.noop]
+            reply = None
+            if pending:
+                netconf_config = provisioning.netconf_changes(
+                    [(plan.changes[0], plan.spec) for plan in pending], delete_operation="remove"
+                )
+                bot_logging.log_payload(log, "NETCONF edit-config", netconf_config, host=host)
+                reply = connection.edit_config(target="running", config=netconf_config)
+                bot_logging.log_payload(log, "NETCONF edit-config reply", reply.xml, host=host)
+        ok = reply is None or _edit_ok(reply, host)
+        for plan in pending:
+            reconcile.applied(host, plan, ok)
+
+        result = provisioning.throughput(len(specs), time.perf_counter() - start)
+        skipped = reconcile.summary(plans)
+        skipped = f", {skipped}" if skipped else ""
+        if ok:
+            return f"Bulk {action} of {len(specs)} loopbacks using Netconf: ok{skipped}, {result}."
+        return f"Bulk {action} using Netconf failed{skipped}, {result}."
     except Exception as exc:
-        print(f"NETCONF status error: {exc}")
-        return "Cannot get status : Interface loopback 66070112 (check by Netconf)."
+        log.warning("NETCONF bulk %s error: %s", action, exc)
+        for spec in specs:
+            reconcile.invalidate(host, spec.name)
+        return f"Bulk {action} using Netconf failed."
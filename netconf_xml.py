@@ -0,0 +1,198 @@
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from lxml import etree
+
+import provisioning
+import reconcile
+
+
+NETCONF_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+IF_NS = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+IP_NS = "urn:ietf:params:xml:ns:yang:ietf-ip"
+NAMESPACES = {"nc": NETCONF_NS, "if": IF_NS, "ip": IP_NS}
+
+# ncclient already holds each reply as an lxml tree (reply.data_ele), so only the
+# needed leaves are pulled out with compiled XPath instead of building nested dicts.
+_CONFIG_INTERFACES = etree.XPath("if:interfaces/if:interface", namespaces=NAMESPACES)
+_CONFIG_INTERFACE = etree.XPath("if:interfaces/if:interface[if:name = $name]", namespaces=NAMESPACES)
+_STATE_INTERFACE = etree.XPath("if:interfaces-state/if:interface[if:name = $name]", namespaces=NAMESPACES)
+_RPC_ERRORS = etree.XPath("//nc:rpc-error", namespaces=NAMESPACES)
+_OK = etree.XPath("boolean(/nc:rpc-reply/nc:ok)", namespaces=NAMESPACES)
+
+_NAME = f"{{{IF_NS}}}name"
+_ENABLED = f"{{{IF_NS}}}enabled"
+_ADMIN_STATUS = f"{{{IF_NS}}}admin-status"
+_OPER_STATUS = f"{{{IF_NS}}}oper-status"
+_ADDRESS = f"{{{IP_NS}}}ipv4/{{{IP_NS}}}address"
+_IP = f"{{{IP_NS}}}ip"
+_NETMASK = f"{{{IP_NS}}}netmask"
+
+_parser = etree.XMLParser(remove_blank_text=True, huge_tree=True)
+
+Source = Union[str, bytes, etree._Element]
+
+
+class RpcError(NamedTuple):
+    severity: str
+    tag: str
+    message: str
+
+
+def parse(source: Source) -> etree._Element:
+    if isinstance(source, etree._Element):
+        return source
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    return etree.fromstring(source, _parser)
+
+
+def data_element(source: Source) -> Optional[etree._Element]:
+    root = parse(source)
+    if root.tag == f"{{{NETCONF_NS}}}data":
+        return root
+    return root.find(f"{{{NETCONF_NS}}}data")
+
+
+def reply_errors(source: Source) -> List[RpcError]:
+    errors = []
+    for error in _RPC_ERRORS(parse(source)):
+        errors.append(RpcError(
+            error.findtext(f"{{{NETCONF_NS}}}error-severity", "error").strip(),
+            error.findtext(f"{{{NETCONF_NS}}}error-tag", "").strip(),
+            " ".join(error.findtext(f"{{{NETCONF_NS}}}error-message", "").split()),
+        ))
+    return errors
+
+
+def reply_ok(source: Source) -> bool:
+    # RFC 6241: success is <ok/>, or only warning-severity rpc-errors; any other
+    # rpc-error fails the operation, whatever namespace prefix the device used.
+    root = parse(source)
+    errors = reply_errors(root)
+    if any(error.severity != "warning" for error in errors):
+        return False
+    return bool(errors) or _OK(root)
+
+
+def _interface_state(interface: etree._Element) -> reconcile.InterfaceState:
+    address = interface.find(_ADDRESS)
+    return reconcile.InterfaceState(
+        interface.findtext(_ENABLED, "true").strip() != "false",
+        address.findtext(_IP) if address is not None else None,
+        address.findtext(_NETMASK) if address is not None else None,
+    )
+
+
+def interface_state(data: Optional[etree._Element], name: str) -> Optional[reconcile.InterfaceState]:
+    if data is None:
+        return reconcile.ABSENT
+    match = _CONFIG_INTERFACE(data, name=name)
+    return _interface_state(match[0]) if match else reconcile.ABSENT
+
+
+def interface_states(data: Optional[etree._Element]) -> Dict[str, reconcile.InterfaceState]:
+    if data is None:
+        return {}
+    return {interface.findtext(_NAME): _interface_state(interface) for interface in _CONFIG_INTERFACES(data)}
+
+
+def interface_status(data: Optional[etree._Element], name: str) -> Optional[Tuple[str, str]]:
+    # (admin-status, oper-status) from interfaces-state, or None if the interface is absent.
+    if data is None:
+        return None
+    match = _STATE_INTERFACE(data, name=name)
+    if not match:
+        return None
+    return match[0].findtext(_ADMIN_STATUS), match[0].findtext(_OPER_STATUS)
+
+
+#######################################################################################
+# Synthetic replies for benchmarking against the previous xmltodict-based parsing.
+
+def synthetic_reply(count: int, state: bool = False) -> str:
+    specs = [provisioning.loopback_for(str(66070000 + idx)) for idx in range(count)]
+    if state:
+        body = "".join(
+            f"<interface><name>{spec.name}</name><admin-status>up</admin-status>"
+            f"<oper-status>up</oper-status></interface>"
+            for spec in specs
+        )
+        container = f'<interfaces-state xmlns="{IF_NS}">{body}</interfaces-state>'
+    else:
+        body = "".join(provisioning.netconf_interface("create", spec) for spec in specs)
+        container = f'<interfaces xmlns="{IF_NS}">{body}</interfaces>'
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<rpc-reply xmlns="{NETCONF_NS}" message-id="urn:uuid:bench"><data>{container}</data></rpc-reply>'
+    )
+
+
+def _xmltodict_states(reply_xml: str) -> dict:
+    import xmltodict
+
+    reply_dict = xmltodict.parse(reply_xml)
+    interfaces = (reply_dict.get("rpc-reply", {}).get("data") or {}).get("interfaces") or {}
+    interface = interfaces.get("interface") or []
+    states = {}
+    for item in interface if isinstance(interface, list) else [interface]:
+        address = (item.get("ipv4") or {}).get("address") or {}
+        states[item.get("name")] = reconcile.InterfaceState(
+            item.get("enabled", "true") != "false", address.get("ip"), address.get("netmask")
+        )
+    return states
+
+
+def _xmltodict_status(reply_xml: str, name: str):
+    import xmltodict
+
+    interface = xmltodict.parse(reply_xml)["rpc-reply"]["data"]["interfaces-state"]["interface"]
+    match = next((item for item in interface if item.get("name") == name), None)
+    return (match.get("admin-status"), match.get("oper-status")) if match else None
+
+
+def _timed(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_parse(count: int = 10000, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    # Seconds per reply (best of repeat). "lxml" includes parsing the reply text;
+    # "xpath" is what the bot pays, since ncclient has already parsed the reply.
+    config_xml = synthetic_reply(count)
+    state_xml = synthetic_reply(count, state=True)
+    last = provisioning.loopback_for(str(66070000 + count - 1)).name
+    config_data = data_element(config_xml)
+    state_data = data_element(state_xml)
+
+    assert interface_states(config_data) == _xmltodict_states(config_xml)
+    assert interface_status(state_data, last) == _xmltodict_status(state_xml, last)
+
+    return {
+        "running_states": {
+            "xmltodict": _timed(lambda: _xmltodict_states(config_xml), repeat),
+            "lxml": _timed(lambda: interface_states(data_element(config_xml)), repeat),
+            "xpath": _timed(lambda: interface_states(config_data), repeat),
+        },
+        "status": {
+            "xmltodict": _timed(lambda: _xmltodict_status(state_xml, last), repeat),
+            "lxml": _timed(lambda: interface_status(data_element(state_xml), last), repeat),
+            "xpath": _timed(lambda: interface_status(state_data, last), repeat),
+        },
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for operation, timings in bench_parse(total).items():
+        baseline = timings["xmltodict"]
+        print(f"{operation} ({total} interfaces):")
+        for parser, elapsed in timings.items():
+            print(f"  {parser:<9} {elapsed * 1000:8.1f} ms  x{baseline / elapsed:.1f}")
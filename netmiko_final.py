@@ -1,20 +1,26 @@
+import logging
 import netmiko
-from pprint import pprint
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import textfsm
 
+import interface_history
+
 device_ip = os.getenv("DEVICE_IP")
 username = os.getenv("userNAME")
 password = os.getenv("passWORD")
+conn_timeout = int(os.getenv("NETMIKO_CONN_TIMEOUT", "10"))
+read_timeout = int(os.getenv("NETMIKO_READ_TIMEOUT", "30"))
+log = logging.getLogger(__name__)
 
 device_params = {
     "device_type": "cisco_ios",
     "ip": device_ip,
     "username": username,
     "password": password,
+    "conn_timeout": conn_timeout,
 }
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -46,7 +52,7 @@ def _parse_motd(output: str) -> str:
             fsm = textfsm.TextFSM(template_file)
             parsed_rows = fsm.ParseText(text)
     except Exception as exc:
-        print(f"TextFSM MOTD parse error: {exc}")
+        log.warning("TextFSM MOTD parse error: %s", exc)
         return text
 
     if not parsed_rows or "BANNER_LINE" not in fsm.header:
@@ -60,53 +66,72 @@ def _parse_motd(output: str) -> str:
 def motd_banner(target_ip: Optional[str] = None) -> str:
     params = _build_device_params(target_ip)
     with netmiko.ConnectHandler(**params) as ssh:
-        output = ssh.send_command("show banner motd")
+        output = ssh.send_command("show banner motd", read_timeout=read_timeout)
     return _parse_motd(output)
 
 
-def gigabit_status():
-    ans = ""
-    with netmiko.ConnectHandler(**device_params) as ssh:
-        up = down = admin_down = 0
-        result = ssh.send_command("show ip interface brief", use_textfsm=True)
-
-        # TextFSM returns a list of dicts; if it is not available we fall back to manual parsing.
-        if isinstance(result, str):
-            parsed = []
-            for line in result.splitlines():
-                if not line or line.lower().startswith("interface"):
-                    continue
-                if not line.startswith("GigabitEthernet"):
-                    continue
-                parts = line.split()
-                if len(parts) < 6:
-                    continue
-                parsed.append(
-                    {
-                        "interface": parts[0],
-                        "status": parts[4],
-                        "protocol": parts[5],
-                    }
-                )
-        else:
-            parsed = result
-
-        statuses = []
-        for interface in parsed:
-            name = interface.get("interface") or interface.get("intf") or interface.get("Interface", "")
-            if not name.startswith("GigabitEthernet"):
+def _parse_interface_brief(result) -> List[Tuple[str, str]]:
+    # TextFSM returns a list of dicts; if it is not available we fall back to manual parsing.
+    if isinstance(result, str):
+        parsed = []
+        for line in result.splitlines():
+            if not line or line.lower().startswith("interface"):
+                continue
+            parts = line.split()
+            if len(parts) < 6:
                 continue
-            status = (interface.get("status") or interface.get("Status") or "").lower()
-            if status == "administratively down":
-                admin_down += 1
-            elif status == "up":
-                up += 1
-            elif status == "down":
-                down += 1
-            statuses.append(f"{name} {status or 'unknown'}")
-
-        status_line = ", ".join(statuses) if statuses else "No GigabitEthernet interfaces found"
-        summary_line = f"-> {up} up, {down} down, {admin_down} administratively down"
-        ans = f"{status_line} {summary_line}".strip()
-        pprint(ans)
-        return ans
+            status = parts[4]
+            if status == "administratively" and len(parts) >= 7:
+                status = "administratively down"
+            parsed.append({"interface": parts[0], "status": status})
+    else:
+        parsed = result
+
+    rows = []
+    for interface in parsed:
+        name = interface.get("interface") or interface.get("intf") or interface.get("Interface", "")
+        status = (interface.get("status") or interface.get("Status") or "").lower()
+        if name:
+            rows.append((name, status))
+    return rows
+
+
+def interface_states(target_ip: Optional[str] = None) -> List[Tuple[str, str]]:
+    params = _build_device_params(target_ip)
+    with netmiko.ConnectHandler(**params) as ssh:
+        result = ssh.send_command("show ip interface brief", use_textfsm=True, read_timeout=read_timeout)
+    return _parse_interface_brief(result)
+
+
+def format_gigabit_status(rows: List[Tuple[str, str]]) -> str:
+    up = down = admin_down = 0
+    statuses = []
+    for name, status in rows:
+        if not name.startswith("GigabitEthernet"):
+            continue
+        if status == "administratively down":
+            admin_down += 1
+        elif status == "up":
+            up += 1
+        elif status == "down":
+            down += 1
+        statuses.append(f"{name} {status or 'unknown'}")
+
+    status_line = ", ".join(statuses) if statuses else "No GigabitEthernet interfaces found"
+    summary_line = f"-> {up} up, {down} down, {admin_down} administratively down"
+    return f"{status_line} {summary_line}".strip()
+
+
+def gigabit_status(target_ip: Optional[str] = None):
+    # Answer from the background sampler's latest sample when it is fresh enough;
+    # otherwise query the router and record the result in the history, which posts
+    # any change it reveals through the history's listeners.
+    device = target_ip or device_ip
+    rows = interface_history.history.latest(device)
+    from_history = rows is not None
+    if not from_history:
+        rows = interface_states(device)
+        interface_history.history.record(device, rows)
+    ans = format_gigabit_status(rows)
+    log.info("gigabit_status: %s", ans, extra={"host": device, "from_history": from_history})
+    return ans
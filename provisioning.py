@@ -0,0 +1,230 @@
+import os
+import re
+import time
+from string import Template
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+
+DEFAULT_STUDENT_ID = "66070112"
+LOOPBACK_NETMASK = "255.255.255.0"
+STUDENT_ID_RE = re.compile(r"^\d{3,}$")
+# Upper bound on the loopbacks one bulk command may touch.
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "500"))
+
+
+class LoopbackSpec(NamedTuple):
+    student_id: str
+    name: str
+    ip: str
+    netmask: str
+
+
+def loopback_for(student_id: str) -> LoopbackSpec:
+    # README rule: last three digits "xyy" -> 172.x.yy.1/24, e.g. 66070123 -> 172.1.23.1, 66070016 -> 172.0.16.1.
+    student_id = str(student_id).strip()
+    if not STUDENT_ID_RE.match(student_id):
+        raise ValueError(f"Invalid student ID: {student_id!r}")
+    x = int(student_id[-3])
+    y = int(student_id[-2:])
+    return LoopbackSpec(student_id, f"Loopback{student_id}", f"172.{x}.{y}.1", LOOPBACK_NETMASK)
+
+
+def _expand(part: str, limit: Optional[int], count: int = 0) -> List[str]:
+    # One single ID or inclusive range; sizes are checked before expanding, so
+    # "100-99999999" is rejected without building it.
+    start, sep, end = part.partition("-")
+    if not sep:
+        loopback_for(part)
+        return [part]
+    if not (STUDENT_ID_RE.match(start) and STUDENT_ID_RE.match(end)) or int(end) < int(start):
+        raise ValueError(f"Invalid student ID range: {part!r}")
+    if limit is not None and count + int(end) - int(start) + 1 > limit:
+        raise ValueError(f"Too many student IDs, at most {limit} per command.")
+    width = len(start)
+    return [str(value).zfill(width) for value in range(int(start), int(end) + 1)]
+
+
+def _unique(ids: List[str]) -> List[str]:
+    seen = set()
+    return [student_id for student_id in ids if not (student_id in seen or seen.add(student_id))]
+
+
+def registered_ids() -> List[str]:
+    # STUDENT_IDS takes single IDs and ranges; invalid entries are skipped.
+    raw = os.getenv("STUDENT_IDS", DEFAULT_STUDENT_ID)
+    ids = []
+    for part in raw.replace(" ", ",").split(","):
+        try:
+            ids.extend(_expand(part, None))
+        except ValueError:
+            continue
+    return _unique(ids) or [DEFAULT_STUDENT_ID]
+
+
+def parse_id_spec(
+    tokens: Iterable[str],
+    limit: Optional[int] = BULK_MAX_IDS,
+    scope: Optional[Iterable[str]] = None,
+) -> List[str]:
+    # Accepts "all", single IDs, comma lists and inclusive ranges such as 66070001-66070500.
+    # With a scope (the IDs a room serves), "all" means that scope and anything outside it
+    # is rejected.
+    scope = list(scope) if scope is not None else None
+    ids = []
+    for token in tokens:
+        for part in token.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if part.lower() == "all":
+                ids.extend(scope if scope is not None else registered_ids())
+                continue
+            ids.extend(_expand(part, limit, len(ids)))
+
+    if limit is not None and len(ids) > limit:
+        raise ValueError(f"Too many student IDs, at most {limit} per command.")
+
+    if scope is not None:
+        allowed = set(scope)
+        outside = [student_id for student_id in ids if student_id not in allowed]
+        if outside:
+            shown = ", ".join(outside[:3]) + (", ..." if len(outside) > 3 else "")
+            raise ValueError(f"Student IDs not served in this room: {shown}")
+
+    return _unique(ids)
+
+
+#######################################################################################
+# Payload templates are compiled once at import; rendering is plain substitution.
+
+RESTCONF_CREATE = Template(
+    '{"name": "$name", "description": "Created via RESTCONF", '
+    '"type": "iana-if-type:softwareLoopback", '
+    '"ietf-ip:ipv4": {"address": [{"ip": "$ip", "netmask": "$netmask"}]}}'
+)
+RESTCONF_ENABLED = Template('{"name": "$name", "enabled": $enabled}')
+RESTCONF_SINGLE = Template('{"ietf-interfaces:interface": $interface}')
+# Replaces the whole ipv4 container, so a wrong address is swapped rather than added.
+RESTCONF_ADDRESS = Template('{"ietf-ip:ipv4": {"address": [{"ip": "$ip", "netmask": "$netmask"}]}}')
+RESTCONF_LIST = Template('{"ietf-interfaces:interfaces": {"interface": [$interfaces]}}')
+
+NETCONF_CREATE = Template(
+    "<interface>"
+    "<name>$name</name>"
+    "<description>Created via NETCONF</description>"
+    '<type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">ianaift:softwareLoopback</type>'
+    "<enabled>true</enabled>"
+    '<ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">'
+    "<address><ip>$ip</ip><netmask>$netmask</netmask></address>"
+    "</ipv4>"
+    "</interface>"
+)
+NETCONF_DELETE = Template('<interface nc:operation="$operation"><name>$name</name></interface>')
+NETCONF_ADDRESS = Template(
+    "<interface><name>$name</name>"
+    '<ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip" nc:operation="replace">'
+    "<address><ip>$ip</ip><netmask>$netmask</netmask></address>"
+    "</ipv4></interface>"
+)
+NETCONF_ENABLED = Template("<interface><name>$name</name><enabled>$enabled</enabled></interface>")
+NETCONF_CONFIG = Template(
+    "<config>"
+    '<interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces" '
+    'xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">'
+    "$interfaces"
+    "</interfaces>"
+    "</config>"
+)
+NETCONF_STATUS_FILTER = Template(
+    "<filter>"
+    '<interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">'
+    "<interface><name>$name</name></interface>"
+    "</interfaces-state>"
+    "</filter>"
+)
+NETCONF_CONFIG_FILTER = Template(
+    "<filter>"
+    '<interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">'
+    "<interface>$match</interface>"
+    "</interfaces>"
+    "</filter>"
+)
+
+ACTIONS = ("create", "delete", "enable", "disable")
+
+
+def restconf_interface(action: str, spec: LoopbackSpec) -> str:
+    if action == "create":
+        return RESTCONF_CREATE.substitute(spec._asdict())
+    if action in {"enable", "disable"}:
+        return RESTCONF_ENABLED.substitute(name=spec.name, enabled="true" if action == "enable" else "false")
+    raise ValueError(f"No RESTCONF payload for {action!r}")
+
+
+def restconf_payload(action: str, spec: LoopbackSpec) -> str:
+    return RESTCONF_SINGLE.substitute(interface=restconf_interface(action, spec))
+
+
+def restconf_address_payload(spec: LoopbackSpec) -> str:
+    return RESTCONF_ADDRESS.substitute(ip=spec.ip, netmask=spec.netmask)
+
+
+def restconf_list_payload(action: str, specs: List[LoopbackSpec]) -> str:
+    return RESTCONF_LIST.substitute(interfaces=", ".join(restconf_interface(action, spec) for spec in specs))
+
+
+def netconf_interface(action: str, spec: LoopbackSpec, delete_operation: str = "delete") -> str:
+    if action == "create":
+        return NETCONF_CREATE.substitute(spec._asdict())
+    if action == "delete":
+        return NETCONF_DELETE.substitute(name=spec.name, operation=delete_operation)
+    if action == "address":
+        return NETCONF_ADDRESS.substitute(spec._asdict())
+    if action in {"enable", "disable"}:
+        return NETCONF_ENABLED.substitute(name=spec.name, enabled="true" if action == "enable" else "false")
+    raise ValueError(f"No NETCONF payload for {action!r}")
+
+
+def netconf_changes(changes: List[Tuple[str, LoopbackSpec]], delete_operation: str = "delete") -> str:
+    # One edit-config for a mix of per-interface changes, e.g. creates plus address fixes.
+    return NETCONF_CONFIG.substitute(
+        interfaces="".join(netconf_interface(action, spec, delete_operation) for action, spec in changes)
+    )
+
+
+def netconf_config(action: str, specs: List[LoopbackSpec], delete_operation: str = "delete") -> str:
+    return netconf_changes([(action, spec) for spec in specs], delete_operation)
+
+
+def netconf_status_filter(spec: LoopbackSpec) -> str:
+    return NETCONF_STATUS_FILTER.substitute(name=spec.name)
+
+
+def netconf_config_filter(spec: Optional[LoopbackSpec] = None) -> str:
+    return NETCONF_CONFIG_FILTER.substitute(match=f"<name>{spec.name}</name>" if spec else "")
+
+
+def throughput(count: int, elapsed: float) -> str:
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    return f"{count} in {elapsed:.2f}s ({rate:.1f}/s)"
+
+
+def bench_render(count: int = 500) -> dict:
+    specs = [loopback_for(str(66070000 + idx)) for idx in range(count)]
+    results = {}
+    for transport, render in (
+        ("restconf", lambda: [restconf_payload("create", spec) for spec in specs]),
+        ("netconf", lambda: netconf_config("create", specs)),
+    ):
+        start = time.perf_counter()
+        render()
+        results[transport] = throughput(count, time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    for transport, result in bench_render(total).items():
+        print(f"{transport}: rendered {result}")
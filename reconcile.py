@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from provisioning import LoopbackSpec
+
+
+CACHE_TTL = float(os.getenv("RECONCILE_CACHE_TTL", "30"))
+log = logging.getLogger(__name__)
+
+
+class InterfaceState(NamedTuple):
+    enabled: bool
+    ip: Optional[str]
+    netmask: Optional[str]
+
+
+# Cached marker for "interface does not exist on the device".
+ABSENT = None
+
+StateFetcher = Callable[[Optional[str], LoopbackSpec], Optional[InterfaceState]]
+BulkStateFetcher = Callable[[Optional[str]], Dict[str, InterfaceState]]
+
+
+class Plan(NamedTuple):
+    action: str
+    spec: LoopbackSpec
+    current: Optional[InterfaceState]
+    changes: Tuple[str, ...]
+    # Why nothing is sent: "in-sync" (already desired) or "missing" (nothing to change).
+    skip_reason: Optional[str]
+
+    @property
+    def noop(self) -> bool:
+        return not self.changes
+
+
+_lock = threading.Lock()
+_cache: Dict[Tuple[str, str], Tuple[Optional[InterfaceState], float]] = {}
+_stats = {"planned": 0, "writes_sent": 0, "writes_skipped": 0, "fetches": 0, "cache_hits": 0}
+
+
+def _cached(host: str, name: str) -> Tuple[bool, Optional[InterfaceState]]:
+    with _lock:
+        entry = _cache.get((host, name))
+        if entry is None or time.monotonic() - entry[1] > CACHE_TTL:
+            return False, ABSENT
+        _stats["cache_hits"] += 1
+        return True, entry[0]
+
+
+def remember(host: Optional[str], name: str, state: Optional[InterfaceState]) -> None:
+    with _lock:
+        _cache[(host or "", name)] = (state, time.monotonic())
+
+
+def invalidate(host: Optional[str], name: Optional[str] = None) -> None:
+    with _lock:
+        for key in list(_cache):
+            if key[0] == (host or "") and (name is None or key[1] == name):
+                del _cache[key]
+
+
+def diff(action: str, spec: LoopbackSpec, current: Optional[InterfaceState]) -> Tuple[Tuple[str, ...], Optional[str]]:
+    if action == "create":
+        if current is ABSENT:
+            return ("create",), None
+        if (current.ip, current.netmask) != (spec.ip, spec.netmask):
+            return ("address",), None
+        return (), "in-sync"
+    if action == "delete":
+        if current is ABSENT:
+            return (), "missing"
+        return ("delete",), None
+    if action in {"enable", "disable"}:
+        if current is ABSENT:
+            return (), "missing"
+        if current.enabled == (action == "enable"):
+            return (), "in-sync"
+        return (action,), None
+    raise ValueError(f"Unknown action {action!r}")
+
+
+def plan(action: str, host: Optional[str], spec: LoopbackSpec, fetch: StateFetcher) -> Plan:
+    hit, current = _cached(host or "", spec.name)
+    if not hit:
+        with _lock:
+            _stats["fetches"] += 1
+        try:
+            current = fetch(host, spec)
+        except Exception as exc:
+            # Without a known running state fall back to sending the change as before.
+            log.warning("Reconcile fetch error for %s: %s", spec.name, exc)
+            with _lock:
+                _stats["planned"] += 1
+                _stats["writes_sent"] += 1
+            return Plan(action, spec, ABSENT, (action,), None)
+        remember(host, spec.name, current)
+
+    changes, skip_reason = diff(action, spec, current)
+    with _lock:
+        _stats["planned"] += 1
+        _stats["writes_skipped" if not changes else "writes_sent"] += 1
+    return Plan(action, spec, current, changes, skip_reason)
+
+
+def plan_bulk(action: str, host: Optional[str], specs: List[LoopbackSpec], fetch_all: BulkStateFetcher) -> List[Plan]:
+    # One read of the whole interface table instead of one per loopback.
+    with _lock:
+        _stats["fetches"] += 1
+    try:
+        states = fetch_all(host)
+    except Exception as exc:
+        log.warning("Reconcile fetch error for %s: %s", host, exc)
+        with _lock:
+            _stats["planned"] += len(specs)
+            _stats["writes_sent"] += len(specs)
+        return [Plan(action, spec, ABSENT, (action,), None) for spec in specs]
+
+    plans = []
+    for spec in specs:
+        current = states.get(spec.name, ABSENT)
+        remember(host, spec.name, current)
+        changes, skip_reason = diff(action, spec, current)
+        plans.append(Plan(action, spec, current, changes, skip_reason))
+
+    sent = sum(1 for item in plans if item.changes)
+    with _lock:
+        _stats["planned"] += len(plans)
+        _stats["writes_sent"] += sent
+        _stats["writes_skipped"] += len(plans) - sent
+    return plans
+
+
+def applied(host: Optional[str], plan_: Plan, success: bool) -> None:
+    # Write-through on success; on failure the device state is unknown, so forget it.
+    if not success:
+        invalidate(host, plan_.spec.name)
+        return
+
+    if plan_.action == "delete":
+        remember(host, plan_.spec.name, ABSENT)
+    elif plan_.changes == ("address",):
+        remember(host, plan_.spec.name, plan_.current._replace(ip=plan_.spec.ip, netmask=plan_.spec.netmask))
+    elif plan_.action == "create":
+        remember(host, plan_.spec.name, InterfaceState(True, plan_.spec.ip, plan_.spec.netmask))
+    elif plan_.current is not ABSENT:
+        remember(host, plan_.spec.name, plan_.current._replace(enabled=plan_.action == "enable"))
+
+
+def summary(plans: List[Plan]) -> str:
+    skipped = [item for item in plans if item.noop]
+    if not skipped:
+        return ""
+    return f"{len(skipped)} no-op ({len(plans) - len(skipped)} changed)"
+
+
+def stats() -> dict:
+    with _lock:
+        result = dict(_stats)
+    # Compared with always writing: every skipped write is saved, every fetch is an extra read.
+    result["round_trips_saved"] = result["writes_skipped"] - result["fetches"]
+    return result
@@ -0,0 +1,191 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import bot_logging
+import webex_client
+
+
+COALESCE_WINDOW = float(os.getenv("REPLY_COALESCE_WINDOW", "0.5"))
+# Webex rejects message text above 7439 bytes; leave room for the part marker.
+MAX_MESSAGE_BYTES = 7000
+SEND_WORKERS = int(os.getenv("REPLY_SEND_WORKERS", "4"))
+MAX_RETRIES = 3
+log = logging.getLogger(__name__)
+
+
+def split_text(text: str, max_bytes: int = MAX_MESSAGE_BYTES) -> List[str]:
+    chunks = []
+    current = ""
+
+    for line in text.split("\n"):
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate.encode("utf-8")) <= max_bytes:
+            current = candidate
+            continue
+
+        if current:
+            chunks.append(current)
+        current = ""
+
+        # A single line longer than the cap is cut on character boundaries.
+        while len(line.encode("utf-8")) > max_bytes:
+            cut = max_bytes
+            while len(line[:cut].encode("utf-8")) > max_bytes:
+                cut -= 1
+            chunks.append(line[:cut])
+            line = line[cut:]
+        current = line
+
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+
+class _Batch:
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.items: List[Tuple[Optional[str], str]] = []
+        self.correlation_ids: List[str] = []
+
+
+class ReplyQueue:
+    def __init__(
+        self,
+        access_token: str,
+        window: float = COALESCE_WINDOW,
+        max_bytes: int = MAX_MESSAGE_BYTES,
+        workers: int = SEND_WORKERS,
+    ):
+        self.access_token = access_token
+        self.window = window
+        self.max_bytes = max_bytes
+
+        # One keep-alive pool shared by every sender thread.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webex-reply")
+
+        self._cond = threading.Condition()
+        self._batches: Dict[Tuple[str, Optional[str]], _Batch] = {}
+        self._closed = False
+        self._stats = {"commands": 0, "api_calls": 0, "messages_coalesced": 0, "failed_calls": 0}
+
+        self._thread = threading.Thread(target=self._flush_loop, name="webex-reply-flush", daemon=True)
+        self._thread.start()
+
+    def put(
+        self,
+        room_id: str,
+        text: str,
+        requester: Optional[str] = None,
+        attachments: Optional[Sequence] = None,
+        label: Optional[str] = None,
+        command: bool = False,
+    ) -> None:
+        # Only replies that answer a chat command count towards "commands"; broadcasts
+        # and busy notices still count as API calls.
+        if command:
+            with self._cond:
+                self._stats["commands"] += 1
+
+        # Webex allows one file per message, so attachment replies are never merged.
+        if attachments:
+            self._executor.submit(contextvars.copy_context().run, self._send, room_id, text, attachments)
+            return
+
+        key = (room_id, requester)
+        with self._cond:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(time.monotonic() + self.window)
+            else:
+                self._stats["messages_coalesced"] += 1
+            batch.items.append((label, text))
+            batch.correlation_ids.append(bot_logging.correlation_id.get())
+            self._cond.notify()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [key for key, batch in self._batches.items() if batch.deadline <= now]
+                    if due:
+                        break
+                    deadlines = [batch.deadline for batch in self._batches.values()]
+                    self._cond.wait(timeout=(min(deadlines) - now) if deadlines else None)
+                else:
+                    due = list(self._batches)
+
+                ready = [(key, self._batches.pop(key)) for key in due]
+                closed = self._closed
+
+            for (room_id, _), batch in ready:
+                self._executor.submit(self._send_batch, room_id, batch)
+            if closed:
+                return
+
+    def _format(self, batch: _Batch) -> str:
+        if len(batch.items) == 1:
+            return batch.items[0][1]
+        return "\n\n".join(f"{label}: {text}" if label else text for label, text in batch.items)
+
+    def _send_batch(self, room_id: str, batch: _Batch) -> None:
+        chunks = split_text(self._format(batch), self.max_bytes)
+        with bot_logging.correlation(",".join(dict.fromkeys(batch.correlation_ids))):
+            log.debug("Posting reply", extra={"replies": len(batch.items), "parts": len(chunks)})
+            for idx, chunk in enumerate(chunks, start=1):
+                if len(chunks) > 1:
+                    chunk = f"{chunk}\n({idx}/{len(chunks)})"
+                self._send(room_id, chunk)
+
+    def _send(self, room_id: str, text: str, attachments: Optional[Sequence] = None) -> None:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                resp = webex_client.post_message(
+                    self.access_token,
+                    room_id,
+                    text,
+                    attachments,
+                    session=self._session,
+                )
+            except Exception as exc:
+                log.warning("Webex reply error: %s", exc)
+                resp = None
+
+            with self._cond:
+                self._stats["api_calls"] += 1
+
+            if resp is not None and resp.status_code == 429 and attempt < MAX_RETRIES:
+                time.sleep(float(resp.headers.get("Retry-After", "1")))
+                continue
+            if resp is None or resp.status_code != 200:
+                with self._cond:
+                    self._stats["failed_calls"] += 1
+                status = resp.status_code if resp is not None else "no response"
+                log.warning("Incorrect reply from Webex Teams API. Status code: %s", status)
+            return
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+        commands = stats["commands"]
+        stats["api_calls_per_command"] = round(stats["api_calls"] / commands, 2) if commands else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._session.close()
@@ -1,7 +1,14 @@
-import json
+import logging
 import requests
 import os
+import time
+from typing import List, Optional
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import bot_logging
+import provisioning
+import reconcile
 
 load_dotenv()
 
@@ -16,6 +23,15 @@ headers = {
     "Content-Type": "application/yang-data+json"
 }
 basicauth = (os.getenv("userNAME"), os.getenv("passWORD"))
+REQUEST_TIMEOUT = 30
+# One keep-alive pool shared by every room and worker, with up to
+# RESTCONF_POOL_SIZE connections kept open per router.
+RESTCONF_POOL_HOSTS = int(os.getenv("RESTCONF_POOL_HOSTS", "16"))
+RESTCONF_POOL_SIZE = int(os.getenv("RESTCONF_POOL_SIZE", os.getenv("WORKER_POOL_SIZE", "4")))
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=RESTCONF_POOL_HOSTS, pool_maxsize=RESTCONF_POOL_SIZE))
+log = logging.getLogger(__name__)
+STUDENT_ID = provisioning.DEFAULT_STUDENT_ID
 
 # def debug_env():
 #     print("=== Environment Debug ===")
@@ -26,139 +42,290 @@ basicauth = (os.getenv("userNAME"), os.getenv("passWORD"))
 #     print("========================")
 
 
-def create():
+def _base_url(host: Optional[str] = None) -> str:
+    # Commands for different routers may run concurrently, so the target is passed
+    # per call instead of being written into the module-level api_url.
+    return f"https://{host}/restconf/" if host else api_url
+
+
+def _log_exchange(resp) -> None:
+    request = resp.request
+    bot_logging.log_payload(log, "RESTCONF request", request.body or "", method=request.method, url=request.url)
+    bot_logging.log_payload(log, "RESTCONF reply", resp.text, status=resp.status_code)
+
+
+def _interface_url(host: Optional[str], name: str) -> str:
+    return _base_url(host) + f"data/ietf-interfaces:interfaces/interface={name}"
+
+
+def _interface_state(interface: dict) -> reconcile.InterfaceState:
+    addresses = interface.get("ietf-ip:ipv4", {}).get("address", [])
+    address = addresses[0] if addresses else {}
+    return reconcile.InterfaceState(
+        interface.get("enabled", True),
+        address.get("ip"),
+        address.get("netmask"),
+    )
+
+
+def running_state(host: Optional[str], spec: provisioning.LoopbackSpec):
+    resp = _session.get(
+        _interface_url(host, spec.name),
+        auth=basicauth,
+        headers=headers,
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
+        )
+    _log_exchange(resp)
+    if resp.status_code == 404:
+        return reconcile.ABSENT
+    resp.raise_for_status()
+    return _interface_state(resp.json().get("ietf-interfaces:interface", {}))
+
+
+def running_states(host: Optional[str]):
+    resp = _session.get(
+        _base_url(host) + "data/ietf-interfaces:interfaces",
+        auth=basicauth,
+        headers=headers,
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
+        )
+    _log_exchange(resp)
+    resp.raise_for_status()
+    interfaces = resp.json().get("ietf-interfaces:interfaces", {}).get("interface", [])
+    return {interface.get("name"): _interface_state(interface) for interface in interfaces}
+
+
+def create(host: Optional[str] = None, student_id: str = STUDENT_ID):
     # debug_env()
-    yangConfig = {
-        "ietf-interfaces:interface": {
-            "name": "Loopback66070112",
-            "description": "Created via RESTCONF",
-            "type": "iana-if-type:softwareLoopback",
-            "ietf-ip:ipv4": {
-                "address": [
-                    {
-                        "ip": "172.1.12.1",
-                        "netmask": "255.255.255.0"
-                    }
-                ]
-            }
-        }
-    }
-
-    resp = requests.post(
-        api_url + "data/ietf-interfaces:interfaces",
-        data=json.dumps(yangConfig),
+    spec = provisioning.loopback_for(student_id)
+    plan = reconcile.plan("create", host, spec, running_state)
+    if plan.noop:
+        return f"Cannot create: Interface loopback {student_id} : Interface {student_id} already exists."
+    if plan.changes == ("address",):
+        return _set_address(host, plan, student_id)
+
+    resp = _session.post(
+        _base_url(host) + "data/ietf-interfaces:interfaces",
+        data=provisioning.restconf_payload("create", spec),
         auth=basicauth,
         headers=headers,
-        verify=False
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
         )
+    _log_exchange(resp)
 
+    reconcile.applied(host, plan, 200 <= resp.status_code <= 299)
     if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface 66070112 created successfully by using Restconf."
+        log.debug("STATUS OK: %s", resp.status_code)
+        return f"Interface {student_id} created successfully by using Restconf."
     elif resp.status_code == 409:
-        print('Cannot create: Interface loopback 66070112 {}'.format(resp.text))
-        return "Cannot create: Interface loopback 66070112 : Interface 66070112 already exists."
+        log.info("Cannot create: Interface loopback %s already exists", student_id)
+        return f"Cannot create: Interface loopback {student_id} : Interface {student_id} already exists."
     else:
-        print('Error. Status Code: {}'.format(resp.status_code))
+        log.warning("Error. Status Code: %s", resp.status_code)
         return "Create failed."
 
 
-def delete():
-    resp = requests.delete(
-        api_url + "data/ietf-interfaces:interfaces/interface=Loopback66070112",
+def _address_request(host: Optional[str], spec: provisioning.LoopbackSpec):
+    resp = _session.put(
+        _interface_url(host, spec.name) + "/ietf-ip:ipv4",
+        data=provisioning.restconf_address_payload(spec),
+        auth=basicauth,
+        headers=headers,
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
+        )
+    _log_exchange(resp)
+    return resp
+
+
+def _set_address(host: Optional[str], plan: reconcile.Plan, student_id: str):
+    # The loopback exists with the wrong address; only its ipv4 container is replaced.
+    resp = _address_request(host, plan.spec)
+    reconcile.applied(host, plan, 200 <= resp.status_code <= 299)
+    if 200 <= resp.status_code <= 299:
+        return (
+            f"Interface loopback {student_id} already exists, address updated to "
+            f"{plan.spec.ip}/{plan.spec.netmask} by using Restconf."
+        )
+    log.warning("Error. Status Code: %s", resp.status_code)
+    return "Create failed."
+
+
+def delete(host: Optional[str] = None, student_id: str = STUDENT_ID):
+    spec = provisioning.loopback_for(student_id)
+    plan = reconcile.plan("delete", host, spec, running_state)
+    if plan.noop:
+        return f"Cannot delete: Interface loopback {student_id} using Restconf."
+
+    resp = _session.delete(
+        _interface_url(host, spec.name),
         auth=basicauth,
         headers=headers,
-        verify=False
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
         )
+    _log_exchange(resp)
 
+    reconcile.applied(host, plan, 200 <= resp.status_code <= 299)
     if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface Loopback 66070112 deleted successfully using Restconf."
+        log.debug("STATUS OK: %s", resp.status_code)
+        return f"Interface Loopback {student_id} deleted successfully using Restconf."
     else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot delete: Interface loopback 66070112 using Restconf."
-
-def enable():
-    yangConfig = {
-        "ietf-interfaces:interface": {
-            "name": "Loopback66070112",
-            "enabled": True
-        }
-    }
-
-    resp = requests.patch(
-        api_url + "data/ietf-interfaces:interfaces/interface=Loopback66070112",
-        data=json.dumps(yangConfig),
+        log.warning("Error. Status Code: %s", resp.status_code)
+        return f"Cannot delete: Interface loopback {student_id} using Restconf."
+
+def enable(host: Optional[str] = None, student_id: str = STUDENT_ID):
+    spec = provisioning.loopback_for(student_id)
+    plan = reconcile.plan("enable", host, spec, running_state)
+    if plan.skip_reason == "missing":
+        return f"Cannot enable : Interface loopback {student_id} (check by Restconf)."
+    if plan.noop:
+        return f"Interface loopback {student_id} is already enabled, no change sent (check by Restconf)."
+
+    resp = _session.patch(
+        _interface_url(host, spec.name),
+        data=provisioning.restconf_payload("enable", spec),
         auth=basicauth,
         headers=headers,
-        verify=False
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
         )
+    _log_exchange(resp)
 
+    reconcile.applied(host, plan, 200 <= resp.status_code <= 299)
     if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface loopback 66070112 enabled successfully (check by Restconf)."
+        log.debug("STATUS OK: %s", resp.status_code)
+        return f"Interface loopback {student_id} enabled successfully (check by Restconf)."
     else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot enable : Interface loopback 66070112 (check by Restconf)."
+        log.warning("Error. Status Code: %s", resp.status_code)
+        return f"Cannot enable : Interface loopback {student_id} (check by Restconf)."
 
 
-def disable():
-    yangConfig = {
-        "ietf-interfaces:interface": {
-            "name": "Loopback66070112",
-            "enabled": False
-        }
-    }
+def disable(host: Optional[str] = None, student_id: str = STUDENT_ID):
+    spec = provisioning.loopback_for(student_id)
+    plan = reconcile.plan("disable", host, spec, running_state)
+    if plan.skip_reason == "missing":
+        return f"Cannot shutdown : Interface loopback {student_id} (check by Restconf)."
+    if plan.noop:
+        return f"Interface loopback {student_id} is already shutdown, no change sent (check by Restconf)."
 
-    resp = requests.patch(
-        api_url + "data/ietf-interfaces:interfaces/interface=Loopback66070112",
-        data=json.dumps(yangConfig),
+    resp = _session.patch(
+        _interface_url(host, spec.name),
+        data=provisioning.restconf_payload("disable", spec),
         auth=basicauth,
         headers=headers,
-        verify=False
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
         )
+    _log_exchange(resp)
 
+    reconcile.applied(host, plan, 200 <= resp.status_code <= 299)
     if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
-        return "Interface loopback 66070112 shutdowned successfully (check by Restconf)."
+        log.debug("STATUS OK: %s", resp.status_code)
+        return f"Interface loopback {student_id} shutdowned successfully (check by Restconf)."
     else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot shutdown : Interface loopback 66070112 (check by Restconf)."
+        log.warning("Error. Status Code: %s", resp.status_code)
+        return f"Cannot shutdown : Interface loopback {student_id} (check by Restconf)."
 
 
-def status():
-    api_ch4k_status = api_url + "data/ietf-interfaces:interfaces-state"
+def status(host: Optional[str] = None, student_id: str = STUDENT_ID):
+    spec = provisioning.loopback_for(student_id)
+    api_ch4k_status = _base_url(host) + "data/ietf-interfaces:interfaces-state"
 
-    resp = requests.get(
+    resp = _session.get(
         api_ch4k_status,
         auth=basicauth,
         headers=headers,
-        verify=False
+        verify=False,
+        timeout=REQUEST_TIMEOUT,
         )
+    _log_exchange(resp)
 
     if(resp.status_code >= 200 and resp.status_code <= 299):
-        print("STATUS OK: {}".format(resp.status_code))
+        log.debug("STATUS OK: %s", resp.status_code)
 
         #Used an AI to help write this part for parsing JSON response. --> Start
         response_json = resp.json()
         interfaces = response_json.get("ietf-interfaces:interfaces-state", {}).get("interface", [])
-        loopback = next((i for i in interfaces if i.get("name") == "Loopback66070112"), None)
+        loopback = next((i for i in interfaces if i.get("name") == spec.name), None)
 
         if not loopback:
-            return "No Interface loopback 66070112."
+            return f"No Interface loopback {student_id}."
 
         admin_status = loopback.get("admin-status")
         oper_status = loopback.get("oper-status")
 
         if admin_status == 'up' and oper_status == 'up':
-            return "Interface loopback 66070112 is currently enabled (check by Restconf)."
+            return f"Interface loopback {student_id} is currently enabled (check by Restconf)."
         elif admin_status == 'down' and oper_status == 'down':
-            return "Interface loopback 66070112 is currently disabled (check by Restconf)."
+            return f"Interface loopback {student_id} is currently disabled (check by Restconf)."
         # <-- End
 
     elif(resp.status_code == 404):
-        print("STATUS NOT FOUND: {}".format(resp.status_code))
-        return "No Interface loopback 66070112 (check by Restconf)."
+        log.info("STATUS NOT FOUND: %s", resp.status_code)
+        return f"No Interface loopback {student_id} (check by Restconf)."
     else:
-        print('Error. Status Code: {}'.format(resp.status_code))
-        return "Cannot get status : Interface loopback 66070112 (check by Restconf)."
+        log.warning("Error. Status Code: %s", resp.status_code)
+        return f"Cannot get status : Interface loopback {student_id} (check by Restconf)."
+
+
+def bulk(action: str, host: Optional[str], student_ids: List[str]):
+    # create/enable/disable merge every loopback that actually differs into one PATCH
+    # on the interfaces container; RESTCONF has no list delete, so deletes reuse the
+    # shared keep-alive session.
+    specs = [provisioning.loopback_for(student_id) for student_id in student_ids]
+    start = time.perf_counter()
+    plans = reconcile.plan_bulk(action, host, specs, running_states)
+    pending = [plan for plan in plans if not plan.noop]
+    failed = 0
+
+    # Existing loopbacks with a wrong address get their ipv4 container replaced one by one;
+    # a merge in the list PATCH would add a second address instead.
+    for plan in [plan for plan in pending if plan.changes == ("address",)]:
+        pending.remove(plan)
+        resp = _address_request(host, plan.spec)
+        ok = 200 <= resp.status_code <= 299
+        reconcile.applied(host, plan, ok)
+        if not ok:
+            failed += 1
+
+    if action == "delete":
+        for plan in pending:
+            resp = _session.delete(
+                _interface_url(host, plan.spec.name),
+                auth=basicauth,
+                headers=headers,
+                verify=False,
+                timeout=REQUEST_TIMEOUT,
+            )
+            _log_exchange(resp)
+            ok = 200 <= resp.status_code <= 299
+            reconcile.applied(host, plan, ok)
+            if not ok:
+                failed += 1
+    elif pending:
+        resp = _session.patch(
+            _base_url(host) + "data/ietf-interfaces:interfaces",
+            data=provisioning.restconf_list_payload(action, [plan.spec for plan in pending]),
+            auth=basicauth,
+            headers=headers,
+            verify=False,
+            timeout=REQUEST_TIMEOUT,
+        )
+        _log_exchange(resp)
+        ok = 200 <= resp.status_code <= 299
+        for plan in pending:
+            reconcile.applied(host, plan, ok)
+        if not ok:
+            log.warning("Error. Status Code: %s", resp.status_code)
+            failed += len(pending)
+
+    result = provisioning.throughput(len(specs), time.perf_counter() - start)
+    skipped = reconcile.summary(plans)
+    skipped = f", {skipped}" if skipped else ""
+    if failed:
+        return f"Bulk {action} using Restconf: {failed} of {len(specs)} failed{skipped}, {result}."
+    return f"Bulk {action} of {len(specs)} loopbacks using Restconf: ok{skipped}, {result}."
@@ -0,0 +1,287 @@
+import logging
+import os
+import threading
+from collections import deque
+import time
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import bot_logging
+import provisioning
+import worker_pool
+
+
+MESSAGES_URL = "https://webexapis.com/v1/messages"
+# Every room is polled once per ROOM_POLL_INTERVAL; the polls are spread evenly
+# across the interval so the Webex API sees a steady request rate.
+POLL_INTERVAL = float(os.getenv("ROOM_POLL_INTERVAL", "1"))
+POLL_BATCH = int(os.getenv("ROOM_POLL_BATCH", "10"))
+ROOM_CONCURRENCY = int(os.getenv("ROOM_CONCURRENCY", "2"))
+ROOM_QUEUE_DEPTH = int(os.getenv("ROOM_QUEUE_DEPTH", "8"))
+REQUEST_TIMEOUT = 30
+log = logging.getLogger(__name__)
+
+
+class Command(NamedTuple):
+    room_id: str
+    student_id: str
+    command: str
+    requester: Optional[str]
+    correlation_id: str
+
+
+class Room:
+    def __init__(
+        self,
+        room_id: str,
+        student_ids: Optional[List[str]] = None,
+        quota: int = ROOM_CONCURRENCY,
+        queue_depth: int = ROOM_QUEUE_DEPTH,
+    ):
+        self.room_id = room_id
+        # None serves every registered student ID (STUDENT_IDS).
+        self.student_ids = student_ids
+        self.quota = quota
+        self.queue_depth = queue_depth
+        self.queue: Deque[Command] = deque()
+        self.in_flight = 0
+        self.last_message_id: Optional[str] = None
+        # Dispatched jobs, until their worker thread is free again.
+        self.jobs: Dict[int, Tuple[worker_pool.Job, Command]] = {}
+        self.stats = {"received": 0, "dispatched": 0, "rejected": 0}
+
+    @property
+    def label(self) -> str:
+        return self.room_id[-8:]
+
+    def allowed_ids(self) -> List[str]:
+        return self.student_ids if self.student_ids is not None else provisioning.registered_ids()
+
+    def accepts(self, student_id: str) -> bool:
+        return student_id in self.allowed_ids()
+
+
+def parse_rooms(raw: str) -> List[Room]:
+    # "ROOM_A;ROOM_B:66070001-66070040" -- a room may be limited to its own student IDs.
+    rooms = []
+    for entry in raw.split(";"):
+        room_id, sep, id_spec = entry.strip().partition(":")
+        if not room_id:
+            continue
+        student_ids = provisioning.parse_id_spec(id_spec.split(), limit=None) if sep else None
+        rooms.append(Room(room_id.strip(), student_ids))
+    return rooms
+
+
+class RoomScheduler:
+    def __init__(
+        self,
+        access_token: str,
+        rooms: List[Room],
+        handler: Callable[[str, str, str], object],
+        on_done: Callable[[Command, worker_pool.Job], None],
+        reply: Callable[[Command, str], None],
+        pool: Optional[worker_pool.WorkerPool] = None,
+        poll_interval: float = POLL_INTERVAL,
+        batch: int = POLL_BATCH,
+    ):
+        if not rooms:
+            raise ValueError("No Webex rooms configured.")
+        self.rooms = rooms
+        self.handler = handler
+        self.on_done = on_done
+        self.reply = reply
+        self.pool = pool or worker_pool.get_pool()
+        self.poll_interval = poll_interval
+        self.batch = batch
+
+        self._rooms: Dict[str, Room] = {room.room_id: room for room in rooms}
+        self._lock = threading.Lock()
+        self._next = 0
+
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = "Bearer " + access_token
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    def deliver(self, room_id: str, message: dict) -> bool:
+        # Entry point for polled messages; a webhook receiver can call it directly.
+        room = self._rooms.get(room_id)
+        text = message.get("text") or ""
+        if room is None or not text.startswith("/"):
+            return False
+
+        # e.g.  "/66070123 create"
+        student_id, _, command = text[1:].partition(" ")
+        if not command or not room.accepts(student_id):
+            return False
+
+        message_id = message.get("id")
+        item = Command(room_id, student_id, command, message.get("personId"), message_id[-12:] if message_id else "-")
+        with bot_logging.correlation(item.correlation_id):
+            log.info("Received message: %s", text, extra={"room": room.label, "requester": item.requester})
+            # Job control is answered right away, without waiting for a worker.
+            action, _, argument = command.strip().partition(" ")
+            if action in ("jobs", "cancel"):
+                self.reply(item, self.jobs(room) if action == "jobs" else self.cancel(room, argument.strip()))
+                return True
+            with self._lock:
+                room.stats["received"] += 1
+                full = len(room.queue) >= room.queue_depth
+                if full:
+                    room.stats["rejected"] += 1
+                else:
+                    room.queue.append(item)
+            if full:
+                self.reply(item, "Error: Bot is busy, please try again later.")
+                return False
+
+        self.pump()
+        return True
+
+    def _take(self):
+        # Round-robin over rooms, skipping any room already at its concurrency quota.
+        count = len(self.rooms)
+        for offset in range(count):
+            index = (self._next + offset) % count
+            room = self.rooms[index]
+            if room.queue and room.in_flight < room.quota:
+                self._next = (index + 1) % count
+                room.in_flight += 1
+                return room, room.queue.popleft(), index
+        return None, None, None
+
+    def pump(self) -> None:
+        while True:
+            with self._lock:
+                room, item, index = self._take()
+            if item is None:
+                return
+
+            with bot_logging.correlation(item.correlation_id):
+                try:
+                    job = self.pool.submit(
+                        self.handler,
+                        item.command,
+                        item.student_id,
+                        item.room_id,
+                        name=item.command.strip().split(" ")[0] or "command",
+                    )
+                except worker_pool.QueueFullError:
+                    # The shared pool is saturated; keep the command at the head of its
+                    # room's queue and give that room the next turn.
+                    with self._lock:
+                        room.in_flight -= 1
+                        room.queue.appendleft(item)
+                        self._next = index
+                    return
+                log.info("Dispatching command", extra={"room": room.label, "student_id": item.student_id, "command": item.command})
+
+            with self._lock:
+                room.stats["dispatched"] += 1
+                room.jobs[job.id] = (job, item)
+            job.add_done_callback(lambda done, item=item: self._finished(item, done))
+            # The room's slot is only returned once the worker thread is free again; a
+            # timed-out job still stuck in a device call keeps counting against its room.
+            job.add_release_callback(lambda done, room=room: self._released(room, done))
+
+    def _finished(self, item: Command, job: worker_pool.Job) -> None:
+        try:
+            self.on_done(item, job)
+        except Exception as exc:
+            log.warning("Reply for job %s failed: %s", job.id, exc)
+
+    def _released(self, room: Room, job: worker_pool.Job) -> None:
+        with self._lock:
+            room.in_flight -= 1
+            room.jobs.pop(job.id, None)
+        self.pump()
+
+    def jobs(self, room: Room) -> str:
+        with self._lock:
+            jobs = sorted(room.jobs.items())
+            queued = len(room.queue)
+        now = time.monotonic()
+        lines = []
+        for job_id, (job, item) in jobs:
+            if job.future.done():
+                state = "timed out, device call still running" if job.timed_out() else "finishing"
+            elif job.started_at is None:
+                state = "waiting for a worker"
+            else:
+                state = f"running {now - job.started_at:.0f}s"
+            lines.append(f"Job {job_id}: /{item.student_id} {item.command} ({state})")
+        lines.append(f"Queued in this room: {queued}")
+        return "\n".join(lines)
+
+    def cancel(self, room: Room, argument: str) -> str:
+        # Only jobs dispatched from this room can be cancelled from it.
+        if not argument.isdigit():
+            return "Error: Usage: cancel <job id> (see jobs)."
+        job_id = int(argument)
+        with self._lock:
+            entry = room.jobs.get(job_id)
+        if entry is None:
+            return f"Error: No job {job_id} in this room."
+        job, item = entry
+        if not self.pool.cancel(job.id):
+            return f"Job {job_id} has already finished."
+        log.info("Cancelled job %s", job_id, extra={"room": room.label, "student_id": item.student_id, "command": item.command})
+        return f"Job {job_id} (/{item.student_id} {item.command}) cancelled."
+
+    def poll(self, room: Room) -> float:
+        # Returns how long to back off before the next request (Retry-After on 429).
+        # The first poll of a room only looks at its newest message, as the single-room loop did.
+        max_items = 1 if room.last_message_id is None else self.batch
+        resp = self._session.get(
+            MESSAGES_URL,
+            params={"roomId": room.room_id, "max": max_items},
+            timeout=REQUEST_TIMEOUT,
+        )
+        log.debug("Response status code: %s", resp.status_code, extra={"room": room.label, "sample": True})
+        bot_logging.log_payload(log, "Webex poll", resp.text, room=room.label, sample=True)
+
+        if resp.status_code == 429:
+            return float(resp.headers.get("Retry-After", "1"))
+        if resp.status_code != 200:
+            log.warning("Incorrect reply from Webex Teams API. Status code: %s", resp.status_code, extra={"room": room.label})
+            return 0.0
+
+        fresh = []
+        for message in resp.json().get("items", []):
+            if message.get("id") == room.last_message_id:
+                break
+            fresh.append(message)
+        if not fresh:
+            return 0.0
+        if room.last_message_id is not None and len(fresh) == max_items:
+            log.warning("More than %s new messages since the last poll; older ones were skipped", max_items, extra={"room": room.label})
+
+        room.last_message_id = fresh[0].get("id")
+        for message in reversed(fresh):
+            self.deliver(room.room_id, message)
+        return 0.0
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        stop = stop or threading.Event()
+        gap = self.poll_interval / len(self.rooms)
+        while not stop.is_set():
+            for room in self.rooms:
+                try:
+                    backoff = self.poll(room)
+                except Exception as exc:
+                    log.warning("Webex poll error: %s", exc, extra={"room": room.label})
+                    backoff = 0.0
+                # Completions normally refill the pool, but a job that finished while the
+                # pool was full needs this periodic nudge.
+                self.pump()
+                if stop.wait(gap + backoff):
+                    return
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                room.label: dict(room.stats, queued=len(room.queue), running=room.in_flight)
+                for room in self.rooms
+            }
@@ -0,0 +1,62 @@
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import config_index
+
+
+BACKUP = config_index.BACKUP_DIR / "show_run_66070112_CSRv1000.txt"
+SNAPSHOT = "show_run_66070112_CSRv1000-10.0.15.61.txt"
+
+
+def _index(tmp_path):
+    shutil.copy(BACKUP, tmp_path / SNAPSHOT)
+    index = config_index.ConfigIndex(tmp_path)
+    index.refresh()
+    return index
+
+
+def test_find_matches_partial_tokens_when_whole_token_exists(tmp_path):
+    index = _index(tmp_path)
+    expected = [line for line in BACKUP.read_text().splitlines() if "loopback" in line.lower()]
+
+    assert len(index.find("Loopback")) == len(expected)
+
+
+def test_find_interface_loopback(tmp_path):
+    index = _index(tmp_path)
+    lines = [text for _, _, text in index.find("interface Loopback")]
+
+    assert "interface Loopback66070112" in lines
+    assert all(text.startswith("interface Loopback") for text in lines)
+    assert len(lines) == 7
+
+
+def test_find_section_filter(tmp_path):
+    index = _index(tmp_path)
+
+    assert index.find("Loopback66070112", "interfaces")
+    assert not index.find("Loopback66070112", "routing")
+
+
+def test_legacy_shared_backup_is_not_indexed(tmp_path):
+    index = _index(tmp_path)
+    shutil.copy(BACKUP, tmp_path / BACKUP.name)
+    index.refresh()
+    index.add_snapshot(tmp_path / BACKUP.name)
+
+    assert index.devices() == ["CSRv1000-10.0.15.61"]
+
+
+def test_add_snapshot_indexes_new_tokens(tmp_path):
+    index = _index(tmp_path)
+    snapshot = tmp_path / "show_run_66070112_CSRv1000-10.0.15.62.txt"
+    snapshot.write_text("interface Loopback66079999\n ip address 172.99.99.1 255.255.255.0\n")
+    index.add_snapshot(snapshot)
+
+    assert [text for _, _, text in index.find("Loopback6607999")] == ["interface Loopback66079999"]
+    snapshot.unlink()
+    index.refresh()
+    assert not index.find("Loopback6607999")
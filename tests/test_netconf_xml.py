@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("lxml")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import netconf_xml
+import provisioning
+import reconcile
+
+
+NC = netconf_xml.NETCONF_NS
+
+
+def _reply(body, prefix=""):
+    tag = f"{prefix}:" if prefix else ""
+    xmlns = f"xmlns:{prefix}" if prefix else "xmlns"
+    return f'<{tag}rpc-reply {xmlns}="{NC}" message-id="101">{body}</{tag}rpc-reply>'
+
+
+def _error(severity, tag="operation-failed", message="boom", prefix=""):
+    p = f"{prefix}:" if prefix else ""
+    return (
+        f"<{p}rpc-error><{p}error-type>application</{p}error-type><{p}error-tag>{tag}</{p}error-tag>"
+        f"<{p}error-severity>{severity}</{p}error-severity>"
+        f"<{p}error-message>  {message}\n  </{p}error-message></{p}rpc-error>"
+    )
+
+
+def test_reply_ok():
+    assert netconf_xml.reply_ok(_reply("<ok/>"))
+    assert netconf_xml.reply_ok(_reply("<nc:ok/>", prefix="nc"))
+    assert not netconf_xml.reply_ok(_reply("<data/>"))
+
+
+def test_reply_errors_fail_unless_warning_only():
+    assert not netconf_xml.reply_ok(_reply(_error("error")))
+    assert not netconf_xml.reply_ok(_reply(_error("warning") + _error("error", prefix="nc"), prefix="nc"))
+    assert netconf_xml.reply_ok(_reply(_error("warning")))
+    assert netconf_xml.reply_errors(_reply(_error("error", "in-use", "busy"))) == [
+        netconf_xml.RpcError("error", "in-use", "busy")
+    ]
+
+
+def test_interface_states_from_synthetic_reply():
+    data = netconf_xml.data_element(netconf_xml.synthetic_reply(3))
+    spec = provisioning.loopback_for("66070001")
+
+    states = netconf_xml.interface_states(data)
+
+    assert len(states) == 3
+    assert states[spec.name] == reconcile.InterfaceState(True, spec.ip, spec.netmask)
+    assert netconf_xml.interface_state(data, spec.name) == states[spec.name]
+    assert netconf_xml.interface_state(data, "Loopback1") is reconcile.ABSENT
+    assert netconf_xml.interface_state(None, spec.name) is reconcile.ABSENT
+
+
+def test_interface_status_from_synthetic_reply():
+    data = netconf_xml.data_element(netconf_xml.synthetic_reply(2, state=True))
+
+    assert netconf_xml.interface_status(data, "Loopback66070001") == ("up", "up")
+    assert netconf_xml.interface_status(data, "Loopback1") is None
+    assert netconf_xml.interface_status(None, "Loopback66070001") is None
@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import provisioning
+
+
+@pytest.mark.parametrize(
+    "student_id, ip",
+    [("66070123", "172.1.23.1"), ("66070016", "172.0.16.1"), (" 66070999 ", "172.9.99.1")],
+)
+def test_loopback_for(student_id, ip):
+    spec = provisioning.loopback_for(student_id)
+
+    assert spec.ip == ip
+    assert spec.name == "Loopback" + student_id.strip()
+    assert spec.netmask == "255.255.255.0"
+
+
+@pytest.mark.parametrize("student_id", ["", "12", "6607abc", "66070001-66070002"])
+def test_loopback_for_rejects_invalid_ids(student_id):
+    with pytest.raises(ValueError):
+        provisioning.loopback_for(student_id)
+
+
+def test_parse_id_spec_ranges_and_lists():
+    ids = provisioning.parse_id_spec(["66070001-66070003,66070010", "66070002"])
+
+    assert ids == ["66070001", "66070002", "66070003", "66070010"]
+
+
+@pytest.mark.parametrize("token", ["66070005-66070001", "abc-66070001", "66070001-"])
+def test_parse_id_spec_rejects_bad_ranges(token):
+    with pytest.raises(ValueError):
+        provisioning.parse_id_spec([token])
+
+
+def test_parse_id_spec_limit():
+    assert len(provisioning.parse_id_spec(["66070001-66070005"], limit=5)) == 5
+    with pytest.raises(ValueError, match="at most 5"):
+        provisioning.parse_id_spec(["66070001-66070006"], limit=5)
+    with pytest.raises(ValueError, match="at most 5"):
+        provisioning.parse_id_spec(["66070001-66070003", "66070010-66070012"], limit=5)
+    with pytest.raises(ValueError):
+        provisioning.parse_id_spec(["1000-99999999999"], limit=5)
+
+
+def test_parse_id_spec_all_uses_registered_ids(monkeypatch):
+    monkeypatch.setenv("STUDENT_IDS", "66070001-66070002, bogus,66070009")
+
+    assert provisioning.parse_id_spec(["all"]) == ["66070001", "66070002", "66070009"]
+
+
+def test_parse_id_spec_scope():
+    scope = ["66070001", "66070002", "66070003"]
+
+    assert provisioning.parse_id_spec(["all"], scope=scope) == scope
+    assert provisioning.parse_id_spec(["66070002"], scope=scope) == ["66070002"]
+    with pytest.raises(ValueError, match="not served in this room: 66070004, 66070100"):
+        provisioning.parse_id_spec(["66070003-66070004", "66070100"], scope=scope)
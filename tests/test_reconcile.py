@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import provisioning
+import reconcile
+
+
+SPEC = provisioning.loopback_for("66070123")
+DESIRED = reconcile.InterfaceState(True, SPEC.ip, SPEC.netmask)
+WRONG_ADDRESS = reconcile.InterfaceState(True, "10.9.9.9", "255.255.255.252")
+
+
+@pytest.mark.parametrize(
+    "action, current, expected",
+    [
+        ("create", reconcile.ABSENT, (("create",), None)),
+        ("create", DESIRED, ((), "in-sync")),
+        ("create", WRONG_ADDRESS, (("address",), None)),
+        ("delete", reconcile.ABSENT, ((), "missing")),
+        ("delete", DESIRED, (("delete",), None)),
+        ("enable", DESIRED, ((), "in-sync")),
+        ("disable", DESIRED, (("disable",), None)),
+        ("enable", DESIRED._replace(enabled=False), (("enable",), None)),
+        ("disable", reconcile.ABSENT, ((), "missing")),
+    ],
+)
+def test_diff(action, current, expected):
+    assert reconcile.diff(action, SPEC, current) == expected
+
+
+def test_diff_unknown_action():
+    with pytest.raises(ValueError):
+        reconcile.diff("rename", SPEC, DESIRED)
+
+
+def test_plan_uses_cache_after_first_fetch():
+    host = "10.0.15.201"
+    calls = []
+
+    def fetch(fetch_host, spec):
+        calls.append(fetch_host)
+        return DESIRED
+
+    first = reconcile.plan("create", host, SPEC, fetch)
+    second = reconcile.plan("create", host, SPEC, fetch)
+
+    assert first.noop and first.skip_reason == "in-sync"
+    assert second.noop
+    assert calls == [host]
+    reconcile.invalidate(host)
+
+
+def test_plan_falls_back_to_sending_when_fetch_fails():
+    def fetch(fetch_host, spec):
+        raise OSError("unreachable")
+
+    result = reconcile.plan("delete", "10.0.15.202", SPEC, fetch)
+
+    assert result.changes == ("delete",)
+    assert result.current is reconcile.ABSENT
+
+
+def test_applied_address_fix_keeps_enabled_state():
+    host = "10.0.15.203"
+    current = WRONG_ADDRESS._replace(enabled=False)
+    result = reconcile.plan("create", host, SPEC, lambda fetch_host, spec: current)
+    assert result.changes == ("address",)
+
+    reconcile.applied(host, result, True)
+
+    after = reconcile.plan("create", host, SPEC, lambda fetch_host, spec: pytest.fail("cache not used"))
+    assert after.current == reconcile.InterfaceState(False, SPEC.ip, SPEC.netmask)
+    assert after.skip_reason == "in-sync"
+    reconcile.invalidate(host)
+
+
+def test_applied_failure_forgets_state():
+    host = "10.0.15.204"
+    result = reconcile.plan("create", host, SPEC, lambda fetch_host, spec: reconcile.ABSENT)
+
+    reconcile.applied(host, result, False)
+
+    calls = []
+    reconcile.plan("create", host, SPEC, lambda fetch_host, spec: calls.append(spec) or reconcile.ABSENT)
+    assert calls == [SPEC]
+    reconcile.invalidate(host)
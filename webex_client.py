@@ -0,0 +1,173 @@
+import gzip
+import mimetypes
+import os
+import shutil
+import tarfile
+import tempfile
+import uuid
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+
+WEBEX_MESSAGES_URL = "https://webexapis.com/v1/messages"
+CHUNK_SIZE = 64 * 1024
+UPLOAD_TIMEOUT = 120
+
+# none | gzip | zip; bundles of several files are always archived (zip unless "gzip" -> .tar.gz).
+ATTACHMENT_COMPRESSION = os.getenv("ATTACHMENT_COMPRESSION", "none").lower()
+
+
+class MultipartFileStream:
+    # File-like multipart/form-data body that reads the attachment in chunks, so
+    # requests streams it with a precomputed Content-Length instead of buffering it.
+    # The file is opened up front and sized from that handle, so a backup replaced
+    # on disk mid-upload cannot change the body.
+
+    def __init__(self, fields: Dict[str, str], file_field: str, path: Path, filename: str, content_type: str):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._file = Path(path).open("rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+
+        head = b"".join(
+            self._part_header(name, extra="") + str(value).encode("utf-8") + b"\r\n"
+            for name, value in fields.items()
+        )
+        head += self._part_header(
+            file_field,
+            extra=f'; filename="{filename}"\r\nContent-Type: {content_type}',
+        )
+        self._head = head
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+        self._length = len(self._head) + self._size + len(self._tail)
+        self._chunks = self._iter_chunks()
+        self._buffer = b""
+
+    def _part_header(self, name: str, extra: str) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"{extra}\r\n\r\n'
+        ).encode("utf-8")
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        yield self._head
+        remaining = self._size
+        with self._file:
+            while remaining:
+                chunk = self._file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError("Attachment shrank while uploading.")
+                remaining -= len(chunk)
+                yield chunk
+        yield self._tail
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self._buffer + b"".join(self._chunks)
+
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _gzip_file(path: Path, workdir: Path) -> Path:
+    target = workdir / f"{path.name}.gz"
+    with path.open("rb") as source, gzip.open(target, "wb") as destination:
+        shutil.copyfileobj(source, destination, CHUNK_SIZE)
+    return target
+
+
+def _zip_files(paths: Sequence[Path], workdir: Path, name: str) -> Path:
+    target = workdir / f"{name}.zip"
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path in paths:
+            archive.write(path, arcname=path.name)
+    return target
+
+
+def _tar_gz_files(paths: Sequence[Path], workdir: Path, name: str) -> Path:
+    target = workdir / f"{name}.tar.gz"
+    with tarfile.open(target, "w:gz") as archive:
+        for path in paths:
+            archive.add(path, arcname=path.name)
+    return target
+
+
+@contextmanager
+def prepared_attachment(paths: Sequence[Path], compression: Optional[str] = None, bundle_name: str = "backups"):
+    # Yields (path, content_type) for a single upload; archives are written to a
+    # temporary directory on disk and removed once the upload is finished.
+    paths = [Path(path) for path in paths]
+    mode = (compression or ATTACHMENT_COMPRESSION).lower()
+
+    if len(paths) == 1 and mode not in {"gzip", "zip"}:
+        content_type = mimetypes.guess_type(paths[0].name)[0] or "text/plain"
+        yield paths[0], content_type
+        return
+
+    workdir = Path(tempfile.mkdtemp(prefix="webex-upload-"))
+    try:
+        if len(paths) == 1 and mode == "gzip":
+            yield _gzip_file(paths[0], workdir), "application/gzip"
+        elif mode == "gzip":
+            yield _tar_gz_files(paths, workdir, bundle_name), "application/gzip"
+        else:
+            yield _zip_files(paths, workdir, bundle_name), "application/zip"
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def post_message(
+    access_token: str,
+    room_id: str,
+    text: str,
+    attachment_paths: Optional[Sequence[Path]] = None,
+    compression: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> requests.Response:
+    http = session or requests
+    auth_header = {"Authorization": "Bearer " + access_token}
+
+    if not attachment_paths:
+        return http.post(
+            WEBEX_MESSAGES_URL,
+            json={"roomId": room_id, "text": text},
+            headers=auth_header,
+            timeout=UPLOAD_TIMEOUT,
+        )
+
+    with prepared_attachment(attachment_paths, compression) as (upload_path, content_type):
+        body = MultipartFileStream(
+            {"roomId": room_id, "text": text},
+            "files",
+            upload_path,
+            upload_path.name,
+            content_type,
+        )
+        headers = dict(auth_header)
+        headers["Content-Type"] = body.content_type
+        try:
+            return http.post(WEBEX_MESSAGES_URL, data=body, headers=headers, timeout=UPLOAD_TIMEOUT)
+        finally:
+            body.close()
+
+
+def existing_attachments(paths: Sequence[Path]) -> Tuple[List[Path], List[Path]]:
+    present = [Path(path) for path in paths if os.path.exists(path)]
+    missing = [Path(path) for path in paths if not os.path.exists(path)]
+    return present, missing
@@ -0,0 +1,342 @@
+import contextvars
+import itertools
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Sequence
+
+
+DEFAULT_WORKERS = int(os.getenv("WORKER_POOL_SIZE", "4"))
+DEFAULT_QUEUE_DEPTH = int(os.getenv("WORKER_QUEUE_DEPTH", "16"))
+DEFAULT_JOB_TIMEOUT = float(os.getenv("WORKER_JOB_TIMEOUT", "180"))
+# Threads stuck in a timed-out device call cannot be killed; each one is replaced by a
+# fresh worker, up to this many, after which the pool refuses new jobs.
+MAX_ABANDONED = int(os.getenv("WORKER_MAX_ABANDONED", "4"))
+KILL_GRACE_PERIOD = 5.0
+POLL_INTERVAL = 0.2
+log = logging.getLogger(__name__)
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class JobTimeoutError(TimeoutError):
+    pass
+
+
+class JobCancelledError(RuntimeError):
+    pass
+
+
+_current = threading.local()
+
+
+def current_job() -> Optional["Job"]:
+    return getattr(_current, "job", None)
+
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    try:
+        process.wait(timeout=KILL_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class Job:
+    def __init__(self, job_id: int, name: str, timeout: Optional[float]):
+        self.id = job_id
+        self.name = name
+        self.timeout = timeout
+        self.future: Future = Future()
+        self.cancel_event = threading.Event()
+        # The deadline runs from submission, so time spent queued counts too.
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.abandoned = False
+        self._released = False
+        self._lock = threading.Lock()
+        self._processes: List[subprocess.Popen] = []
+        self._release_callbacks: List[Callable[["Job"], None]] = []
+
+    def remaining(self) -> Optional[float]:
+        if self.timeout is None:
+            return None
+        return max(0.0, self.timeout - (time.monotonic() - self.submitted_at))
+
+    def attach_process(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.append(process)
+
+    def detach_process(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def kill_processes(self) -> None:
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            _kill_process_group(process)
+
+    def cancel(self) -> bool:
+        # Settle the future before killing children so the dying process cannot report success.
+        if not self._finish(exc=JobCancelledError(f"Job {self.name} cancelled.")):
+            return False
+        self.cancel_event.set()
+        self.kill_processes()
+        return True
+
+    def timed_out(self) -> bool:
+        return self.future.done() and isinstance(self.future.exception(), JobTimeoutError)
+
+    def _finish(self, result=None, exc: Optional[BaseException] = None) -> bool:
+        with self._lock:
+            if self.future.done():
+                return False
+            if exc is not None:
+                self.future.set_exception(exc)
+            else:
+                self.future.set_result(result)
+            return True
+
+    def add_done_callback(self, callback: Callable[["Job"], None]) -> None:
+        self.future.add_done_callback(lambda _: callback(self))
+
+    def add_release_callback(self, callback: Callable[["Job"], None]) -> None:
+        # Called once no worker thread is busy with the job any more; for a timed-out
+        # job that is when the stuck call finally returns, not when the future settles.
+        with self._lock:
+            if not self._released:
+                self._release_callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self, timeout: Optional[float] = None):
+        return self.future.result(timeout)
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_queue: int = DEFAULT_QUEUE_DEPTH,
+        default_timeout: Optional[float] = DEFAULT_JOB_TIMEOUT,
+        max_abandoned: int = MAX_ABANDONED,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.max_abandoned = max_abandoned
+        self._queue: queue.Queue = queue.Queue()
+        # Running plus queued jobs; a hung job keeps its slot until its thread returns.
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._ids = itertools.count(1)
+        self._thread_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._threads = 0
+        self._abandoned = 0
+        self._closed = False
+        for _ in range(workers):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        self._threads += 1
+        thread = threading.Thread(
+            target=self._worker,
+            name=f"device-worker-{next(self._thread_ids)}",
+            daemon=True,
+        )
+        thread.start()
+
+    def submit(self, fn: Callable, *args, name: Optional[str] = None, timeout: Optional[float] = None, **kwargs) -> Job:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is shut down.")
+            if self._abandoned >= self.max_abandoned:
+                raise QueueFullError(f"{self._abandoned} workers are stuck on unresponsive devices.")
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Worker queue is full ({self.max_queue} pending jobs).")
+
+        job = Job(next(self._ids), name or getattr(fn, "__name__", "job"), timeout or self.default_timeout)
+        with self._lock:
+            self._active[job.id] = job
+        if job.timeout:
+            timer = threading.Timer(job.timeout, self._expire, (job,))
+            timer.daemon = True
+            job.future.add_done_callback(lambda _: timer.cancel())
+            timer.start()
+        # Run in the submitter's contextvars so log correlation IDs follow the job.
+        self._queue.put((job, contextvars.copy_context(), fn, args, kwargs))
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                with self._lock:
+                    self._threads -= 1
+                return
+            job, context, fn, args, kwargs = item
+            context.run(self._run, job, fn, args, kwargs)
+
+            with self._lock:
+                if not job.abandoned:
+                    continue
+                # The hung call returned; retire this thread if its replacement took over.
+                self._abandoned -= 1
+                if self._threads - self._abandoned > self.workers:
+                    self._threads -= 1
+                    return
+
+    def _run(self, job: Job, fn: Callable, args: Sequence, kwargs: dict) -> None:
+        try:
+            with job._lock:
+                # Cancelled or already past its deadline while queued.
+                if job.future.done():
+                    return
+                job.started_at = time.monotonic()
+
+            _current.job = job
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                job._finish(exc=exc)
+            else:
+                job._finish(result)
+        finally:
+            _current.job = None
+            self._release(job)
+
+    def _expire(self, job: Job) -> None:
+        if not job._finish(exc=JobTimeoutError(f"Job {job.name} exceeded {job.timeout:g}s.")):
+            return
+        # Set only after the future holds the timeout, so run_command can tell the two apart.
+        job.cancel_event.set()
+        log.warning("Worker job %s (%s) timed out after %gs", job.id, job.name, job.timeout)
+        job.kill_processes()
+
+        with self._lock:
+            if job.id not in self._active:
+                return
+            running = job.started_at is not None
+            if running:
+                job.abandoned = True
+                self._abandoned += 1
+                if self._abandoned <= self.max_abandoned and not self._closed:
+                    self._spawn()
+        if not running:
+            # Never started, so no thread holds it; free its slot now.
+            self._release(job)
+
+    def _release(self, job: Job) -> None:
+        with self._lock:
+            if self._active.pop(job.id, None) is None:
+                return
+        self._slots.release()
+        with job._lock:
+            job._released = True
+            callbacks, job._release_callbacks = job._release_callbacks, []
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception as exc:
+                log.warning("Release callback for job %s failed: %s", job.id, exc)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._active)
+
+    def abandoned(self) -> int:
+        with self._lock:
+            return self._abandoned
+
+    def cancel(self, job_id: int) -> bool:
+        with self._lock:
+            job = self._active.get(job_id)
+        return job.cancel() if job else False
+
+    def shutdown(self, cancel_pending: bool = True) -> None:
+        with self._lock:
+            self._closed = True
+            jobs = list(self._active.values())
+            threads = self._threads
+        if cancel_pending:
+            for job in jobs:
+                job.cancel()
+        for _ in range(threads):
+            self._queue.put(None)
+
+
+def run_command(command: Sequence[str], timeout: Optional[float] = None, **popen_kwargs) -> subprocess.CompletedProcess:
+    # Drop-in for subprocess.run(capture_output=True, text=True) that honours the
+    # surrounding job's deadline and cancellation and kills the whole child process group.
+    job = current_job()
+    if job is not None:
+        remaining = job.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+        **popen_kwargs,
+    )
+    if job is not None:
+        job.attach_process(process)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
+        while True:
+            wait = POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            try:
+                stdout, stderr = process.communicate(timeout=wait)
+                break
+            except subprocess.TimeoutExpired:
+                if job is not None and job.cancel_event.is_set():
+                    _kill_process_group(process)
+                    stdout, stderr = process.communicate()
+                    if job.timed_out():
+                        raise subprocess.TimeoutExpired(command, job.timeout, output=stdout, stderr=stderr)
+                    raise JobCancelledError(f"Command {command[0]} cancelled.")
+                if deadline is not None and time.monotonic() >= deadline:
+                    _kill_process_group(process)
+                    stdout, stderr = process.communicate()
+                    raise subprocess.TimeoutExpired(command, timeout, output=stdout, stderr=stderr)
+    finally:
+        if job is not None:
+            job.detach_process(process)
+
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> WorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool